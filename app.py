@@ -1,39 +1,154 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import sys
 import os
 import subprocess
 import json
 import tempfile
+import threading
+import hashlib
+import pickle
+from functools import wraps, lru_cache
+
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from flask_compress import Compress
+    COMPRESS_AVAILABLE = True
+except ImportError:
+    COMPRESS_AVAILABLE = False
 
 app = Flask(__name__)
 
+if COMPRESS_AVAILABLE:
+    # Comprime as respostas (principalmente o HTML das visualizações) com Brotli ou gzip
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+    Compress(app)
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    class ORJSONProvider(JSONProvider):
+        """Provider JSON do Flask baseado em orjson: jsonify e request.get_json passam a usar a extensão em C."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(orjson.dumps(obj, option=_ORJSON_OPTIONS), mimetype='application/json')
+
+    app.json = ORJSONProvider(app)
+
 # Adicionar o diretório atual ao path para importar o módulo
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Importar funções do nosso script
-try:
-    from evasao_upe import (
-        ebm, feature_names, dataset_description, y_axis_description,
-        t2ebm, X_test, y_test, feature_descriptions, get_feature_description
-    )
-    import t2ebm.graphs as graphs
-    import textwrap
+MODEL_LOADED = False
+_load_attempted = False
+_load_lock = threading.Lock()
+
+def _load_model():
+    """Importa o modelo e as dependências pesadas (pandas, sklearn, interpret) e prepara os caches."""
+    global MODEL_LOADED, ebm, feature_names, get_dataset_description, y_axis_description, t2ebm, \
+        X_test, y_test, feature_descriptions, get_feature_description, graphs, llm_config, \
+        get_description_cache, FEATURE_INDEX, EBM_HASH, EBM_GLOBAL, EBM_LOCAL, _FEATURES_JSON
     
-    # Importar novo módulo de configuração de LLM
-    import llm_config
+    # Importar funções do nosso script
+    try:
+        from evasao_upe import (
+            ebm, feature_names, get_dataset_description, y_axis_description,
+            t2ebm, X_test, y_test, feature_descriptions, get_feature_description
+        )
+        import t2ebm.graphs as graphs
+        import textwrap
+        
+        # Importar novo módulo de configuração de LLM
+        import llm_config
+        
+        # Monkey patch para usar o novo sistema multi-provedor
+        t2ebm.llm.chat_completion = llm_config.chat_completion
+        t2ebm.llm.achat_completion = llm_config.achat_completion
+        t2ebm.llm.chat_completion_stream = llm_config.chat_completion_stream
+        t2ebm.llm.setup = llm_config.setup
+        
+        from t2ebm.cache import get_description_cache
+        import t2ebm.functions
+        
+        # Índice de cada feature pelo nome
+        FEATURE_INDEX = {name: i for i, name in enumerate(feature_names)}
+        
+        # Hash do EBM carregado, usado como parte da chave do cache de descrições
+        EBM_HASH = hashlib.sha256(pickle.dumps(ebm)).hexdigest()
+        
+        MODEL_LOADED = True
+    except ImportError as e:
+        print(f"Erro ao importar módulos: {e}")
+        MODEL_LOADED = False
+        return
+    
+    # Monkey patch para que t2ebm.describe_graph/describe_ebm usem as versões memoizadas
+    t2ebm.functions.extract_graph = wraps(graphs.extract_graph)(_extract_graph)
+    t2ebm.functions.graph_to_text = wraps(graphs.graph_to_text)(_cached_graph_text)
     
-    # Monkey patch para usar o novo sistema multi-provedor
-    t2ebm.llm.chat_completion = llm_config.chat_completion
-    t2ebm.llm.setup = llm_config.setup
+    # Explicações global e local (primeiros 5 exemplos), calculadas uma única vez
+    EBM_GLOBAL = ebm.explain_global()
+    EBM_LOCAL = ebm.explain_local(X_test[:5], y_test[:5])
     
-    MODEL_LOADED = True
-except ImportError as e:
-    print(f"Erro ao importar módulos: {e}")
-    MODEL_LOADED = False
+    _precompute_visualizations()
+    _FEATURES_JSON = _build_features_json()
+
+def _ensure_loaded():
+    """Carrega o modelo na primeira chamada e retorna MODEL_LOADED.
+
+    O lock evita carregamentos duplicados em requisições simultâneas.
+    """
+    global _load_attempted
+    if not _load_attempted:
+        with _load_lock:
+            if not _load_attempted:
+                _load_model()
+                _load_attempted = True
+    return MODEL_LOADED
+
+# O ebm é imutável durante a vida do servidor, então a extração dos gráficos e a conversão
+# para texto podem ser calculadas uma única vez por processo.
+@lru_cache(maxsize=None)
+def _cached_graph(feature_index, **kwargs):
+    """extract_graph memoizado por feature."""
+    return graphs.extract_graph(ebm, feature_index, **kwargs)
+
+_GRAPH_TEXT_MEMO = {}
+
+def _cached_graph_text(graph, **kwargs):
+    """graph_to_text memoizado por gráfico (os gráficos vêm de _cached_graph e vivem o processo todo)."""
+    if kwargs.get('ebm') is not ebm:
+        return graphs.graph_to_text(graph, **kwargs)
+    key = (id(graph), tuple(sorted(kwargs.items(), key=lambda item: item[0])))
+    hit = _GRAPH_TEXT_MEMO.get(key)
+    if hit is not None and hit[0] is graph:
+        return hit[1]
+    text = graphs.graph_to_text(graph, **kwargs)
+    _GRAPH_TEXT_MEMO[key] = (graph, text)
+    return text
+
+def _extract_graph(ebm_, feature_index, **kwargs):
+    """extract_graph que usa _cached_graph quando chamado com o ebm da aplicação."""
+    if ebm_ is not ebm:
+        return graphs.extract_graph(ebm_, feature_index, **kwargs)
+    return _cached_graph(feature_index, **kwargs)
 
 @app.route('/')
 def index():
     """Página inicial da aplicação"""
+    _ensure_loaded()
     # Passar features com descrições para o template
     features_with_desc = []
     if MODEL_LOADED:
@@ -48,10 +163,55 @@ def index():
                          features_with_desc=features_with_desc,
                          model_loaded=MODEL_LOADED)
 
+def _llm_error_response(e):
+    """Resposta de erro das rotas que chamam o LLM.
+
+    Erros transitórios do provedor (após as novas tentativas) viram 503 com Retry-After, para que o cliente espere.
+    """
+    if isinstance(e, llm_config.RETRYABLE_ERRORS):
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
+    return jsonify({'error': str(e)}), 500
+
+def cached_description(per_feature):
+    """Decorator que consulta o cache persistente de descrições antes de chamar o LLM.
+
+    A chave considera modelo, feature (ou "global"), idioma, prompt customizado e o hash do EBM.
+    Use o parâmetro de query cache=false para forçar uma nova geração.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper():
+            if not _ensure_loaded() or request.args.get('cache', 'true').lower() != 'true':
+                return view()
+            
+            data = request.get_json(silent=True) or {}
+            feature_index = data.get('feature_index', 0) if per_feature else 'global'
+            cache_args = (
+                data.get('model', 'deepseek-chat'),
+                feature_index,
+                data.get('language', 'Portuguese (Brazil)'),
+                data.get('custom_prompt', ''),
+                EBM_HASH,
+            )
+            cache = get_description_cache()
+            cached = cache.get_cached_description(*cache_args)
+            if cached is not None:
+                payload = app.json.loads(cached)
+                payload['cached'] = True
+                return jsonify(payload)
+            
+            response = view()
+            if isinstance(response, Response) and response.status_code == 200:
+                cache.set_cached_description(*cache_args, response.get_data(as_text=True))
+            return response
+        return wrapper
+    return decorator
+
 @app.route('/api/describe_graph', methods=['POST'])
+@cached_description(per_feature=True)
 def describe_graph():
     """API para descrever um gráfico específico"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     data = request.get_json()
@@ -67,7 +227,7 @@ def describe_graph():
             ebm, 
             feature_index,
             graph_description=y_axis_description,
-            dataset_description=dataset_description,
+            dataset_description=get_dataset_description(),
             task_description=custom_prompt,
             language=language
         )
@@ -79,12 +239,87 @@ def describe_graph():
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _llm_error_response(e)
+
+@app.route('/api/describe_graph_stream', methods=['POST'])
+def describe_graph_stream():
+    """API para descrever um gráfico transmitindo a descrição final via Server-Sent Events"""
+    if not _ensure_loaded():
+        return jsonify({'error': 'Modelo não carregado'}), 500
+    
+    data = request.get_json()
+    feature_index = data.get('feature_index', 0)
+    custom_prompt = data.get('custom_prompt', '')
+    language = data.get('language', 'Portuguese (Brazil)')
+    model = data.get('model', 'deepseek-chat')
+    
+    def generate():
+        try:
+            messages = t2ebm.functions.describe_graph_messages(
+                ebm,
+                feature_index,
+                graph_description=y_axis_description,
+                dataset_description=get_dataset_description(),
+                task_description=custom_prompt,
+                language=language
+            )
+            for token in llm_config.chat_completion_stream(model, messages):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+@app.route('/api/describe_graphs_batch', methods=['POST'])
+def describe_graphs_batch():
+    """API para descrever vários gráficos com uma única chamada ao LLM"""
+    if not _ensure_loaded():
+        return jsonify({'error': 'Modelo não carregado'}), 500
+    
+    data = request.get_json()
+    feature_indices = data.get('feature_indices', [])
+    custom_prompt = data.get('custom_prompt', '')
+    language = data.get('language', 'Portuguese (Brazil)')
+    model = data.get('model', 'deepseek-chat')
+    
+    if not isinstance(feature_indices, list) or not all(
+        isinstance(i, int) and 0 <= i < len(feature_names) for i in feature_indices
+    ):
+        return jsonify({'error': 'Índices de feature inválidos'}), 400
+    
+    try:
+        # Uma requisição por lote de features, com fallback individual para as que falharem
+        descriptions = t2ebm.describe_graphs(
+            model,
+            ebm,
+            feature_indices,
+            graph_description=y_axis_description,
+            dataset_description=get_dataset_description(),
+            task_description=custom_prompt,
+            language=language
+        )
+        
+        return jsonify({
+            'success': True,
+            'descriptions': [
+                {
+                    'feature_index': i,
+                    'feature_name': feature_names[i],
+                    'description': description
+                }
+                for i, description in zip(feature_indices, descriptions)
+            ]
+        })
+    
+    except Exception as e:
+        return _llm_error_response(e)
 
 @app.route('/api/describe_model', methods=['POST'])
+@cached_description(per_feature=False)
 def describe_model():
     """API para descrever o modelo completo"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     data = request.get_json()
@@ -97,7 +332,7 @@ def describe_model():
         description = t2ebm.describe_ebm(
             model, 
             ebm,
-            dataset_description=dataset_description,
+            dataset_description=get_dataset_description(),
             outcome_description=y_axis_description,
             task_description=custom_prompt,
             language=language
@@ -109,14 +344,10 @@ def describe_model():
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _llm_error_response(e)
 
-@app.route('/api/features')
-def get_features():
-    """API para listar as features disponíveis com descrições"""
-    if not MODEL_LOADED:
-        return jsonify({'error': 'Modelo não carregado'}), 500
-    
+def _build_features_json():
+    """Serializa a lista de features com descrições (os dados são fixos após a importação)."""
     features = []
     for i, name in enumerate(feature_names):
         features.append({
@@ -125,13 +356,22 @@ def get_features():
             'description': get_feature_description(name),
             'type': 'categorical' if 'Curso' in name or 'Semestre' in name else 'numeric'
         })
+    return app.json.dumps(features)
+
+_FEATURES_JSON = None
+
+@app.route('/api/features')
+def get_features():
+    """API para listar as features disponíveis com descrições"""
+    if not _ensure_loaded():
+        return jsonify({'error': 'Modelo não carregado'}), 500
     
-    return jsonify(features)
+    return Response(_FEATURES_JSON, mimetype='application/json')
 
 @app.route('/api/feature_description/<string:feature_name>')
 def get_feature_desc(feature_name):
     """API para obter a descrição de uma feature específica"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     description = get_feature_description(feature_name)
@@ -140,23 +380,60 @@ def get_feature_desc(feature_name):
         'description': description
     })
 
+def _explanation_html(explanation, key=None):
+    """Converte uma explicação do interpret em HTML via visualize()."""
+    fig = explanation.visualize() if key is None else explanation.visualize(key)
+    if hasattr(fig, 'to_html'):
+        # Se for um objeto plotly
+        return fig.to_html(include_plotlyjs='cdn', full_html=True)
+    # Fallback: tentar obter dados do objeto
+    data = explanation.data() if key is None else explanation.data(key)
+    return f"<html><body><pre>{str(data)}</pre></body></html>"
+
+# HTML das visualizações por (endpoint, índice), com o ETag correspondente.
+# O ebm e X_test[:5] são fixos, então o HTML é determinístico.
+_VIZ_CACHE = {}
+
+def _get_viz_html(endpoint, index=None):
+    """Retorna (html, etag) da visualização, gerando e guardando no cache se necessário."""
+    key = (endpoint, index)
+    if key not in _VIZ_CACHE:
+        if endpoint == 'global':
+            html_content = _explanation_html(EBM_GLOBAL)
+        elif endpoint == 'feature':
+            html_content = _explanation_html(EBM_GLOBAL, index)
+        else:
+            html_content = _explanation_html(EBM_LOCAL, index)
+        etag = hashlib.sha256(html_content.encode()).hexdigest()
+        _VIZ_CACHE[key] = (html_content, etag)
+    return _VIZ_CACHE[key]
+
+def _html_response(endpoint, index=None):
+    """Resposta HTML com ETag, permitindo 304 em requisições repetidas."""
+    html_content, etag = _get_viz_html(endpoint, index)
+    response = Response(html_content, mimetype='text/html')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def _precompute_visualizations():
+    """Gera antecipadamente o HTML de todas as visualizações."""
+    try:
+        _get_viz_html('global')
+        for i in range(len(feature_names)):
+            _get_viz_html('feature', i)
+        for i in range(min(5, len(X_test))):
+            _get_viz_html('local', i)
+    except Exception as e:
+        print(f"Erro ao pré-computar visualizações: {e}")
+
 @app.route('/api/visualize_global')
 def visualize_global():
     """API para visualização global do modelo EBM usando visualize()"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     try:
-        ebm_global = ebm.explain_global()
-        # Usar visualize() para obter o objeto plotly e converter para HTML
-        fig = ebm_global.visualize()
-        if hasattr(fig, 'to_html'):
-            # Se for um objeto plotly
-            html_content = fig.to_html(include_plotlyjs='cdn', full_html=True)
-        else:
-            # Fallback: tentar obter dados do objeto
-            html_content = f"<html><body><pre>{str(ebm_global.data())}</pre></body></html>"
-        return Response(html_content, mimetype='text/html')
+        return _html_response('global')
     except Exception as e:
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
@@ -164,19 +441,13 @@ def visualize_global():
 @app.route('/api/visualize_feature/<int:feature_index>')
 def visualize_feature(feature_index):
     """API para visualização de uma feature específica por índice usando visualize()"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     try:
-        ebm_global = ebm.explain_global()
         # Para visualização de feature específica
         if feature_index < len(feature_names):
-            fig = ebm_global.visualize(feature_index)
-            if hasattr(fig, 'to_html'):
-                html_content = fig.to_html(include_plotlyjs='cdn', full_html=True)
-            else:
-                html_content = f"<html><body><pre>{str(ebm_global.data(feature_index))}</pre></body></html>"
-            return Response(html_content, mimetype='text/html')
+            return _html_response('feature', feature_index)
         else:
             return jsonify({'error': 'Índice de feature inválido'}), 400
     except Exception as e:
@@ -186,24 +457,18 @@ def visualize_feature(feature_index):
 @app.route('/api/visualize_feature_by_name/<string:feature_name>')
 def visualize_feature_by_name(feature_name):
     """API para visualização de uma feature específica pelo nome usando visualize()"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     try:
         # Encontrar o índice da feature pelo nome
-        if feature_name in feature_names:
-            feature_index = feature_names.index(feature_name)
-        else:
+        try:
+            feature_index = FEATURE_INDEX[feature_name]
+        except KeyError:
             return jsonify({'error': f'Feature "{feature_name}" não encontrada. Features disponíveis: {feature_names}'}), 400
         
-        ebm_global = ebm.explain_global()
         # Usar o índice para visualizar (visualize() aceita apenas índices inteiros)
-        fig = ebm_global.visualize(feature_index)
-        if hasattr(fig, 'to_html'):
-            html_content = fig.to_html(include_plotlyjs='cdn', full_html=True)
-        else:
-            html_content = f"<html><body><pre>{str(ebm_global.data(feature_index))}</pre></body></html>"
-        return Response(html_content, mimetype='text/html')
+        return _html_response('feature', feature_index)
     except Exception as e:
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
@@ -211,19 +476,13 @@ def visualize_feature_by_name(feature_name):
 @app.route('/api/visualize_local/<int:sample_index>')
 def visualize_local(sample_index):
     """API para visualização de explicação local usando visualize()"""
-    if not MODEL_LOADED:
+    if not _ensure_loaded():
         return jsonify({'error': 'Modelo não carregado'}), 500
     
     try:
         # Explicação local para os primeiros 5 exemplos
-        ebm_local = ebm.explain_local(X_test[:5], y_test[:5])
         if sample_index < 5:
-            fig = ebm_local.visualize(sample_index)
-            if hasattr(fig, 'to_html'):
-                html_content = fig.to_html(include_plotlyjs='cdn', full_html=True)
-            else:
-                html_content = f"<html><body><pre>{str(ebm_local.data(sample_index))}</pre></body></html>"
-            return Response(html_content, mimetype='text/html')
+            return _html_response('local', sample_index)
         else:
             return jsonify({'error': 'Índice de amostra inválido'}), 400
     except Exception as e:
@@ -233,6 +492,7 @@ def visualize_local(sample_index):
 @app.route('/api/models')
 def get_available_models():
     """API para listar modelos LLM disponíveis"""
+    _ensure_loaded()
     try:
         models = llm_config.get_available_models()
         api_status = llm_config.check_api_keys()
@@ -247,13 +507,14 @@ def get_available_models():
 def get_cache_stats():
     """API para obter estatísticas de cache"""
     try:
-        from t2ebm.cache import get_llm_cache, get_graph_cache
+        from t2ebm.cache import get_llm_cache, get_graph_cache, get_description_cache
         
         llm_cache = get_llm_cache()
         graph_cache = get_graph_cache()
         
         return jsonify({
             'llm_cache': llm_cache.get_cache_stats(),
+            'description_cache': get_description_cache().get_cache_stats(),
             'graph_cache': {
                 'directory': graph_cache.cache_dir,
                 'exists': os.path.exists(graph_cache.cache_dir)
@@ -275,21 +536,41 @@ def clear_cache():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health')
-def health_check():
-    """Endpoint de health check"""
+def _build_health_json():
+    """Serializa o payload do health check."""
     api_status = {}
     try:
         api_status = llm_config.check_api_keys()
     except:
         pass
     
-    return jsonify({
+    return app.json.dumps({
         'status': 'healthy',
         'model_loaded': MODEL_LOADED,
         'features_count': len(feature_names) if MODEL_LOADED else 0,
         'api_keys_configured': api_status
     })
 
+# Payload do health check por estado de carregamento do modelo; só é refeito quando o estado muda
+_HEALTH_JSON = {}
+
+@app.route('/api/health')
+def health_check():
+    """Endpoint de health check"""
+    _ensure_loaded()
+    if MODEL_LOADED not in _HEALTH_JSON:
+        _HEALTH_JSON[MODEL_LOADED] = _build_health_json()
+    return Response(_HEALTH_JSON[MODEL_LOADED], mimetype='application/json')
+
+# Em produção o modelo é carregado na inicialização, para não penalizar a primeira requisição
+if os.getenv('EAGER_MODEL_LOAD'):
+    _ensure_loaded()
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if os.getenv('FLASK_DEV'):
+        # Servidor de desenvolvimento com reloader e debugger
+        app.run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        # "python app.py" é só para desenvolvimento; em produção o app é servido pelo Gunicorn
+        print("Para produção, use: gunicorn -c gunicorn_conf.py app:app\n"
+              "Para o servidor de desenvolvimento, defina FLASK_DEV=1: FLASK_DEV=1 python app.py")
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura dos CSVs de dados (separador ";" e vírgula decimal), com cópia em Parquet para as leituras seguintes.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def read_csv_pandas(csv_path):
+    """Lê o CSV com pd.read_csv. É a referência para os tipos e valores ausentes."""
+    return pd.read_csv(csv_path, sep=';', decimal=',')
+
+
+def read_csv_pyarrow(csv_path):
+    """Lê o CSV com o leitor multithread do PyArrow, com os mesmos tipos e valores ausentes de read_csv_pandas.
+
+    Retorna uma pyarrow.Table.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    def read(column_types):
+        return pv.read_csv(
+            csv_path,
+            parse_options=pv.ParseOptions(delimiter=';'),
+            convert_options=pv.ConvertOptions(
+                decimal_point=',',
+                # células vazias viram ausentes, como no pandas
+                strings_can_be_null=True,
+                column_types=column_types,
+            ),
+        )
+
+    table = read({})
+    # O pandas não converte datas sem parse_dates; essas colunas são lidas de novo como texto
+    temporal = {f.name: pa.string() for f in table.schema if pa.types.is_temporal(f.type)}
+    if temporal:
+        table = read(temporal)
+    return table
+
+
+def _to_pandas(table):
+    """Converte a tabela com o mesmo tipo de texto que o pd.read_csv infere (str no pandas 3, object antes)."""
+    import pyarrow as pa
+
+    if pd.get_option("future.infer_string"):
+        string_dtype = pd.StringDtype(na_value=np.nan)
+        return table.to_pandas(types_mapper={pa.string(): string_dtype, pa.large_string(): string_dtype}.get)
+    return _to_pandas(table)
+
+
+def read_dataset(csv_path):
+    """Lê o CSV com o PyArrow e guarda uma cópia em Parquet para as próximas leituras.
+
+    Sem o pyarrow instalado, usa pd.read_csv.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return read_csv_pandas(csv_path)
+
+    # o ".v2" invalida as cópias antigas, que guardavam as datas como date32
+    parquet_path = csv_path.with_suffix(".v2.parquet")
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        return _to_pandas(pq.read_table(parquet_path))
+
+    table = read_csv_pyarrow(csv_path)
+    pq.write_table(table, parquet_path)
+    return _to_pandas(table)
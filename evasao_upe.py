@@ -5,6 +5,7 @@ Análise de evasão estudantil na UPE usando Explainable Boosting Machines (EBM)
 e interface de linguagem natural com TalkToEBM
 """
 
+import numpy as np
 import pandas as pd
 import textwrap
 from sklearn.model_selection import train_test_split
@@ -14,29 +15,96 @@ from interpret import show
 
 import t2ebm
 import joblib
+import json
+from functools import lru_cache
 from pathlib import Path
 
+from dataset_reader import read_dataset
+
 # =============================================================================
 # Carregue o dataset evasao_UPE.csv e treine um EBM
 # =============================================================================
 
-print("Carregando dados de evasão da UPE...")
-df = pd.read_csv("notebooks/dados/evasao_UPE.csv", sep=';', decimal=',')
+csv_path = Path("notebooks/dados/evasao_UPE.csv")
+# Arrays tipados derivados do CSV; evitam o pd.read_csv nas importações seguintes
+# (o ".v3" invalida os arquivos antigos, que guardavam todas as colunas numéricas em float32)
+arrays_path = csv_path.with_suffix(".v3.npz")
 
 # Colunas de identificação e a probabilidade pré-calculada são removidas para evitar vazamento do alvo
 cols_to_drop = ["Aluno", "ID do Aluno", "Disciplina", "ID da Disciplina", "PROBABILIDADE"]
-df_model = df.drop(columns=cols_to_drop)
-
-# pandas to numpy array
-X_data = df_model.drop(columns=["EVASAO"]).values
-y_data = df_model["EVASAO"].values
-
-X_train, X_test, y_train, y_test = train_test_split(X_data, y_data, test_size=0.2, random_state=42)
 
-print("Primeiras linhas do dataset:")
-print(df_model.head())
-
-feature_names = df_model.drop(columns=["EVASAO"]).columns.tolist()
+print("Carregando dados de evasão da UPE...")
+if arrays_path.exists() and arrays_path.stat().st_mtime >= csv_path.stat().st_mtime:
+    # As colunas categóricas são guardadas como object para que os valores ausentes continuem ausentes
+    with np.load(arrays_path, allow_pickle=True) as arrays:
+        float32_names = arrays["float32_names"].tolist()
+        float64_names = arrays["float64_names"].tolist()
+        categorical_names = arrays["categorical_names"].tolist()
+        feature_names = arrays["feature_names"].tolist()
+        df_features = pd.concat(
+            [
+                pd.DataFrame(arrays["X_float32"], columns=float32_names),
+                pd.DataFrame(arrays["X_float64"], columns=float64_names),
+                pd.DataFrame(arrays["X_categorical"], columns=categorical_names),
+            ],
+            axis=1,
+        )[feature_names]
+        y_data = arrays["y"]
+else:
+    df = read_dataset(csv_path)
+    df_model = df.drop(columns=cols_to_drop)
+
+    # Linhas com alvo ausente ou fora de {0, 1} não podem ser usadas no treino nem na avaliação
+    target = pd.to_numeric(df_model["EVASAO"], errors="coerce")
+    valid_target = target.isin([0, 1])
+    if not valid_target.all():
+        print(f"Removendo {(~valid_target).sum()} linha(s) com EVASAO ausente ou inválida")
+    df_model = df_model[valid_target].reset_index(drop=True)
+    target = target[valid_target]
+
+    print("Primeiras linhas do dataset:")
+    print(df_model.head())
+
+    df_features = df_model.drop(columns=["EVASAO"])
+    feature_names = df_features.columns.tolist()
+    # Colunas de texto com valores todos numéricos (ex.: Semestre "2010.2", que não usa a vírgula
+    # decimal) são convertidas para número, como no modelo salvo; as demais ficam como categóricas
+    for c in feature_names:
+        if not pd.api.types.is_numeric_dtype(df_features[c]):
+            converted = pd.to_numeric(df_features[c], errors="coerce")
+            if converted.notna().sum() == df_features[c].notna().sum():
+                df_features[c] = converted
+    numeric_names = [c for c in feature_names if pd.api.types.is_numeric_dtype(df_features[c])]
+    categorical_names = [c for c in feature_names if c not in numeric_names]
+    # float32 só nas colunas que não perdem precisão; datas em segundos (~1.3e9), por exemplo, ficam em float64
+    df_features = df_features.astype({c: np.float64 for c in numeric_names})
+    float32_names = [
+        c for c in numeric_names
+        if df_features[c].astype(np.float32).astype(np.float64).equals(df_features[c])
+    ]
+    float64_names = [c for c in numeric_names if c not in float32_names]
+    df_features = df_features.astype({c: np.float32 for c in float32_names})
+    # O alvo é binário, então int8 basta
+    y_data = target.to_numpy(dtype=np.int8)
+
+    np.savez(
+        arrays_path,
+        X_float32=df_features[float32_names].to_numpy(dtype=np.float32),
+        X_float64=df_features[float64_names].to_numpy(dtype=np.float64),
+        X_categorical=df_features[categorical_names].to_numpy(dtype=object),
+        y=y_data,
+        float32_names=np.array(float32_names, dtype=str),
+        float64_names=np.array(float64_names, dtype=str),
+        categorical_names=np.array(categorical_names, dtype=str),
+        feature_names=np.array(feature_names, dtype=str),
+    )
+
+# O EBM recebe o DataFrame tipado em vez de um array object
+X_data = df_features
+feature_types = ["nominal" if c in categorical_names else "continuous" for c in feature_names]
+
+split_params = {"test_size": 0.2, "random_state": 42}
+X_train, X_test, y_train, y_test = train_test_split(X_data, y_data, **split_params)
 
 model_path = Path("notebooks/dados/ebm_upe.joblib")
 model_loaded = model_path.exists()
@@ -47,13 +115,31 @@ if model_loaded:
 else:
     print("Treinando novo modelo EBM...")
     ebm = ExplainableBoostingClassifier(interactions=0, 
-                                        feature_names=feature_names)
+                                        feature_names=feature_names,
+                                        feature_types=feature_types)
     ebm.fit(X_train, y_train)
     model_path.parent.mkdir(parents=True, exist_ok=True)
     joblib.dump(ebm, model_path)
     print(f"Modelo treinado e salvo em {model_path}")
 
-ebm_score = ebm.score(X_test, y_test)
+# A acurácia fica em um arquivo ao lado do modelo e só é recalculada se o modelo,
+# o dataset ou a divisão treino/teste mudarem
+score_path = model_path.with_suffix(".score.json")
+score_key = {
+    "model_mtime": model_path.stat().st_mtime,
+    "dataset": str(csv_path),
+    "dataset_mtime": csv_path.stat().st_mtime,
+    "split": split_params,
+}
+try:
+    cached_score = json.loads(score_path.read_text())
+except (FileNotFoundError, ValueError):
+    cached_score = {}
+if cached_score.get("key") == score_key:
+    ebm_score = cached_score["score"]
+else:
+    ebm_score = ebm.score(X_test, y_test)
+    score_path.write_text(json.dumps({"score": ebm_score, "key": score_key}))
 print(f"Acurácia do modelo EBM: {ebm_score:.4f}")
 
 # =============================================================================
@@ -102,22 +188,33 @@ feature_descriptions = {
     "var33": "Quantidade de atividades entregues pelo aluno fora do prazo, por disciplina.",
 }
 
-# Função para obter descrição de uma feature
+# Função para obter descrição de uma feature (o dicionário de descrições é fixo após a importação)
+def _describe_feature(feature_name):
+    return feature_descriptions.get(feature_name, f"Variável {feature_name} (sem descrição disponível)")
+
+# Descrições das features do modelo, montadas uma vez; nomes desconhecidos não são guardados
+_feature_description_by_name = {fname: _describe_feature(fname) for fname in feature_names}
+
 def get_feature_description(feature_name):
     """Retorna a descrição detalhada de uma feature."""
-    return feature_descriptions.get(feature_name, f"Variável {feature_name} (sem descrição disponível)")
+    try:
+        return _feature_description_by_name[feature_name]
+    except KeyError:
+        return _describe_feature(feature_name)
 
-# Gerar descrição detalhada das features usadas no modelo
+# Gerar descrição detalhada das features usadas no modelo (o resultado não muda após a importação)
+@lru_cache(maxsize=None)
 def get_features_description_text():
     """Gera texto descritivo das features presentes no modelo."""
-    descriptions = []
-    for fname in feature_names:
-        desc = feature_descriptions.get(fname, "Sem descrição disponível")
-        descriptions.append(f"- {fname}: {desc}")
-    return "\n".join(descriptions)
-
-# Descrições para uso com LLM
-dataset_description = f"""Este dataset contém dados de evasão estudantil da UPE (Universidade de Pernambuco) em cursos de educação a distância. Cada linha representa o histórico de um(a) aluno(a) em uma disciplina em um semestre específico.
+    get = feature_descriptions.get
+    default = "Sem descrição disponível"
+    return "\n".join("- " + fname + ": " + get(fname, default) for fname in feature_names)
+
+# Descrições para uso com LLM (montada só quando alguém pede)
+@lru_cache(maxsize=None)
+def get_dataset_description():
+    """Retorna a descrição do dataset usada nos prompts."""
+    return f"""Este dataset contém dados de evasão estudantil da UPE (Universidade de Pernambuco) em cursos de educação a distância. Cada linha representa o histórico de um(a) aluno(a) em uma disciplina em um semestre específico.
 
 **Contexto:** Os dados foram coletados de um Ambiente Virtual de Aprendizagem (AVA/Moodle) e incluem métricas de engajamento, participação e interação dos alunos.
 
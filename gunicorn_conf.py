@@ -0,0 +1,21 @@
+"""
+Configuração do Gunicorn para servir a aplicação em produção.
+
+Uso: gunicorn -c gunicorn_conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+# Carrega o modelo na inicialização de cada worker, e não na primeira requisição
+os.environ.setdefault("EAGER_MODEL_LOAD", "1")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# As chamadas aos LLMs são limitadas por I/O, então cada worker usa várias threads
+workers = int(os.getenv("GUNICORN_WORKERS", 2 * multiprocessing.cpu_count() + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# As descrições do modelo completo podem levar vários minutos
+timeout = 300
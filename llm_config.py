@@ -3,13 +3,24 @@ Configuração centralizada para provedores de LLM.
 As chaves de API são carregadas de variáveis de ambiente ou de um arquivo .env local.
 """
 
+import asyncio
 import os
+import re
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Optional
-from openai import OpenAI, BadRequestError
+from functools import lru_cache, partial
+from typing import Callable, Optional
+import httpx
+from openai import OpenAI, AsyncOpenAI, BadRequestError
 import anthropic
 
+# Política de novas tentativas, cliente httpx e clientes assíncronos por event loop compartilhados com o t2ebm
+from t2ebm.llm import RETRYABLE_ERRORS, AsyncClientPerLoopMixin, _http_client, _retry_transient
+
+
+# KEY=valor, KEY="valor" ou KEY='valor'
+_ENV_RE = re.compile(r"""^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|(.*?))\s*$""")
+
 
 def _load_local_env():
     """Carrega variáveis de um .env local (gitignored) se existir, sem sobrescrever variáveis já definidas."""
@@ -18,16 +29,14 @@ def _load_local_env():
         return
     
     try:
-        with env_path.open() as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#") or "=" not in line:
-                    continue
-                key, value = line.split("=", 1)
-                key = key.strip()
-                value = value.strip().strip('"').strip("'")
-                if key and key not in os.environ:
-                    os.environ[key] = value
+        for line in env_path.read_text().splitlines():
+            if line.lstrip().startswith("#"):
+                continue
+            match = _ENV_RE.match(line)
+            if match:
+                key = match.group(1)
+                value = next(g for g in match.groups()[1:] if g is not None)
+                os.environ.setdefault(key, value)
     except Exception as exc:
         print(f"⚠️  Não foi possível carregar {env_path}: {exc}")
 
@@ -46,8 +55,13 @@ DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
 
 
 @dataclass
-class AbstractChatModel:
-    """Interface base para modelos de chat."""
+class AbstractChatModel(AsyncClientPerLoopMixin):
+    """Interface base para modelos de chat.
+
+    O cliente assíncrono criado por async_client_factory é um por event loop (ver AsyncClientPerLoopMixin).
+    """
+
+    model: str = ""
     
     def chat_completion(self, messages, temperature: float, max_tokens: int) -> str:
         """Envia uma query para o modelo de chat.
@@ -61,42 +75,87 @@ class AbstractChatModel:
         """
         raise NotImplementedError
 
+    def chat_completion_stream(self, messages, temperature: float, max_tokens: int):
+        """Como chat_completion, mas gera a resposta em partes à medida que chega.
+
+        A implementação padrão gera a resposta completa de uma só vez.
+        """
+        yield self.chat_completion(messages, temperature, max_tokens)
+
+    async def achat_completion(self, messages, temperature: float, max_tokens: int) -> str:
+        """Versão assíncrona de chat_completion.
+
+        A implementação padrão executa chat_completion em uma thread.
+        """
+        return await asyncio.to_thread(self.chat_completion, messages, temperature, max_tokens)
+
 
 class OpenAIChatModel(AbstractChatModel):
     """Modelo de chat para OpenAI (GPT-4, GPT-3.5, etc.)"""
+
+    timeout = 120
     
-    def __init__(self, client: OpenAI, model: str):
+    def __init__(self, client: OpenAI, model: str, async_client_factory: Optional[Callable[[], AsyncOpenAI]] = None):
         super().__init__()
         self.client = client
+        self.async_client_factory = async_client_factory
         self.model = model
 
-    def chat_completion(self, messages, temperature: float, max_tokens: int) -> str:
+    def _request_kwargs(self, messages, temp_value, max_tokens: int, use_max_completion_tokens: bool, extra_kwargs):
+        """Monta os parâmetros da chamada à API."""
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "timeout": self.timeout,
+            **extra_kwargs,
+        }
+        if temp_value is not None:
+            kwargs["temperature"] = temp_value
+        if use_max_completion_tokens:
+            kwargs["max_completion_tokens"] = max_tokens
+        else:
+            kwargs["max_tokens"] = max_tokens
+        return kwargs
+
+    def _create(self, messages, temperature: float, max_tokens: int, **extra_kwargs):
+        @_retry_transient
         def _send(temp_value, use_max_completion_tokens=True):
             """Helper para chamar a API com os parâmetros corretos."""
-            kwargs = {
-                "model": self.model,
-                "messages": messages,
-                "timeout": 120,
-            }
-            if temp_value is not None:
-                kwargs["temperature"] = temp_value
-            if use_max_completion_tokens:
-                kwargs["max_completion_tokens"] = max_tokens
+            return self.client.chat.completions.create(
+                **self._request_kwargs(messages, temp_value, max_tokens, use_max_completion_tokens, extra_kwargs)
+            )
+
+        try:
+            return _send(temperature, use_max_completion_tokens=True)
+        except BadRequestError as exc:
+            exc_str = str(exc)
+            if "max_tokens" in exc_str:
+                return _send(temperature, use_max_completion_tokens=False)
+            elif "temperature" in exc_str:
+                return _send(1, use_max_completion_tokens=True)
             else:
-                kwargs["max_tokens"] = max_tokens
-            return self.client.chat.completions.create(**kwargs)
+                raise
+
+    async def _acreate(self, async_client: AsyncOpenAI, messages, temperature: float, max_tokens: int):
+        @_retry_transient
+        async def _send(temp_value, use_max_completion_tokens=True):
+            return await async_client.chat.completions.create(
+                **self._request_kwargs(messages, temp_value, max_tokens, use_max_completion_tokens, {})
+            )
 
         try:
-            response = _send(temperature, use_max_completion_tokens=True)
+            return await _send(temperature, use_max_completion_tokens=True)
         except BadRequestError as exc:
             exc_str = str(exc)
             if "max_tokens" in exc_str:
-                response = _send(temperature, use_max_completion_tokens=False)
+                return await _send(temperature, use_max_completion_tokens=False)
             elif "temperature" in exc_str:
-                response = _send(1, use_max_completion_tokens=True)
+                return await _send(1, use_max_completion_tokens=True)
             else:
                 raise
-        
+
+    @staticmethod
+    def _response_content(response) -> str:
         try:
             response_content = response.choices[0].message.content
         except:
@@ -108,6 +167,23 @@ class OpenAIChatModel(AbstractChatModel):
         
         return response_content
 
+    def chat_completion(self, messages, temperature: float, max_tokens: int) -> str:
+        response = self._create(messages, temperature, max_tokens)
+        return self._response_content(response)
+
+    async def achat_completion(self, messages, temperature: float, max_tokens: int) -> str:
+        async_client = self._get_async_client()
+        if async_client is None:
+            return await super().achat_completion(messages, temperature, max_tokens)
+        response = await self._acreate(async_client, messages, temperature, max_tokens)
+        return self._response_content(response)
+
+    def chat_completion_stream(self, messages, temperature: float, max_tokens: int):
+        stream = self._create(messages, temperature, max_tokens, stream=True)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     def __repr__(self) -> str:
         return f"OpenAI({self.model})"
 
@@ -115,12 +191,13 @@ class OpenAIChatModel(AbstractChatModel):
 class AnthropicChatModel(AbstractChatModel):
     """Modelo de chat para Anthropic Claude."""
     
-    def __init__(self, client: anthropic.Anthropic, model: str):
+    def __init__(self, client: anthropic.Anthropic, model: str, async_client_factory: Optional[Callable[[], anthropic.AsyncAnthropic]] = None):
         super().__init__()
         self.client = client
+        self.async_client_factory = async_client_factory
         self.model = model
 
-    def chat_completion(self, messages, temperature: float, max_tokens: int) -> str:
+    def _request_kwargs(self, messages, temperature: float, max_tokens: int) -> dict:
         # Converter formato OpenAI para formato Anthropic
         anthropic_messages = []
         system_message = None
@@ -134,20 +211,35 @@ class AnthropicChatModel(AbstractChatModel):
                     "content": msg["content"]
                 })
         
+        kwargs = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "messages": anthropic_messages,
+        }
+        
+        if system_message:
+            kwargs["system"] = system_message
+        
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        
+        return kwargs
+
+    def chat_completion(self, messages, temperature: float, max_tokens: int) -> str:
         try:
-            kwargs = {
-                "model": self.model,
-                "max_tokens": max_tokens,
-                "messages": anthropic_messages,
-            }
-            
-            if system_message:
-                kwargs["system"] = system_message
-            
-            if temperature is not None:
-                kwargs["temperature"] = temperature
-            
-            response = self.client.messages.create(**kwargs)
+            response = self.client.messages.create(**self._request_kwargs(messages, temperature, max_tokens))
+            return response.content[0].text
+        
+        except Exception as e:
+            print(f"Erro na API Anthropic: {e}")
+            return ""
+
+    async def achat_completion(self, messages, temperature: float, max_tokens: int) -> str:
+        async_client = self._get_async_client()
+        if async_client is None:
+            return await super().achat_completion(messages, temperature, max_tokens)
+        try:
+            response = await async_client.messages.create(**self._request_kwargs(messages, temperature, max_tokens))
             return response.content[0].text
         
         except Exception as e:
@@ -158,50 +250,10 @@ class AnthropicChatModel(AbstractChatModel):
         return f"Anthropic({self.model})"
 
 
-class DeepSeekChatModel(AbstractChatModel):
-    """Modelo de chat para DeepSeek."""
-    
-    def __init__(self, client: OpenAI, model: str):
-        super().__init__()
-        self.client = client
-        self.model = model
-
-    def chat_completion(self, messages, temperature: float, max_tokens: int) -> str:
-        def _send(temp_value, use_max_completion_tokens=True):
-            kwargs = {
-                "model": self.model,
-                "messages": messages,
-                "timeout": 90,
-            }
-            if temp_value is not None:
-                kwargs["temperature"] = temp_value
-            if use_max_completion_tokens:
-                kwargs["max_completion_tokens"] = max_tokens
-            else:
-                kwargs["max_tokens"] = max_tokens
-            return self.client.chat.completions.create(**kwargs)
+class DeepSeekChatModel(OpenAIChatModel):
+    """Modelo de chat para DeepSeek (API compatível com a da OpenAI)."""
 
-        try:
-            response = _send(temperature, use_max_completion_tokens=True)
-        except BadRequestError as exc:
-            exc_str = str(exc)
-            if "max_tokens" in exc_str:
-                response = _send(temperature, use_max_completion_tokens=False)
-            elif "temperature" in exc_str:
-                response = _send(1, use_max_completion_tokens=True)
-            else:
-                raise
-        
-        try:
-            response_content = response.choices[0].message.content
-        except:
-            print(f"Resposta inválida: {response}")
-            response_content = ""
-        
-        if response_content is None:
-            response_content = ""
-        
-        return response_content
+    timeout = 90
 
     def __repr__(self) -> str:
         return f"DeepSeek({self.model})"
@@ -221,13 +273,39 @@ AVAILABLE_MODELS = {
 }
 
 
+# Pool de conexões dos clientes OpenAI/DeepSeek do app
+_POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+@lru_cache(maxsize=None)
+def _openai_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    """Cliente OpenAI síncrono compartilhado por chave e URL base.
+
+    As novas tentativas do SDK ficam desligadas (max_retries=0); quem repete as chamadas é o _retry_transient.
+    """
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=_http_client(httpx.Client, _POOL_LIMITS))
+
+
+def _async_openai_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """Cria um cliente AsyncOpenAI. Não é compartilhado: os modelos criam um por event loop."""
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=_http_client(httpx.AsyncClient, _POOL_LIMITS))
+
+
+@lru_cache(maxsize=None)
+def _anthropic_client(api_key: str) -> anthropic.Anthropic:
+    """Cliente Anthropic síncrono compartilhado por chave.
+
+    O SDK da Anthropic já mantém seu próprio pool de conexões; basta reaproveitar o cliente.
+    """
+    return anthropic.Anthropic(api_key=api_key)
+
+
 def setup_openai(model: str) -> OpenAIChatModel:
     """Configura um modelo OpenAI."""
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY não configurada. Execute: export OPENAI_API_KEY='sua-chave'")
     
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    return OpenAIChatModel(client, model)
+    return OpenAIChatModel(_openai_client(OPENAI_API_KEY), model, partial(_async_openai_client, OPENAI_API_KEY))
 
 
 def setup_anthropic(model: str) -> AnthropicChatModel:
@@ -235,8 +313,9 @@ def setup_anthropic(model: str) -> AnthropicChatModel:
     if not ANTHROPIC_API_KEY:
         raise ValueError("ANTHROPIC_API_KEY/CLAUDE_API_KEY não configurada. Exporte ANTHROPIC_API_KEY='sua-chave'")
     
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-    return AnthropicChatModel(client, model)
+    return AnthropicChatModel(
+        _anthropic_client(ANTHROPIC_API_KEY), model, partial(anthropic.AsyncAnthropic, api_key=ANTHROPIC_API_KEY)
+    )
 
 
 def setup_deepseek(model: str) -> DeepSeekChatModel:
@@ -244,8 +323,27 @@ def setup_deepseek(model: str) -> DeepSeekChatModel:
     if not DEEPSEEK_API_KEY:
         raise ValueError("DEEPSEEK_API_KEY não configurada. Execute: export DEEPSEEK_API_KEY='sua-chave'")
     
-    client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
-    return DeepSeekChatModel(client, model)
+    return DeepSeekChatModel(
+        _openai_client(DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL),
+        model,
+        partial(_async_openai_client, DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL),
+    )
+
+
+_PROVIDER_DISPATCH = {
+    "openai": setup_openai,
+    "anthropic": setup_anthropic,
+    "deepseek": setup_deepseek,
+}
+
+
+@lru_cache(maxsize=None)
+def _setup_model(model: str) -> AbstractChatModel:
+    """Cria o modelo uma única vez por nome, reaproveitando os clientes (e seus pools de conexão)."""
+    info = AVAILABLE_MODELS.get(model)
+    if info is None:
+        raise ValueError(f"Modelo '{model}' não suportado. Modelos permitidos: {', '.join(AVAILABLE_MODELS)}")
+    return _PROVIDER_DISPATCH[info["provider"]](model)
 
 
 def setup(model: str) -> AbstractChatModel:
@@ -259,20 +357,7 @@ def setup(model: str) -> AbstractChatModel:
     """
     if isinstance(model, AbstractChatModel):
         return model
-
-    if model not in AVAILABLE_MODELS:
-        supported = ", ".join(AVAILABLE_MODELS.keys())
-        raise ValueError(f"Modelo '{model}' não suportado. Modelos permitidos: {supported}")
-
-    provider = AVAILABLE_MODELS[model]["provider"]
-    if provider == "openai":
-        return setup_openai(model)
-    if provider == "anthropic":
-        return setup_anthropic(model)
-    if provider == "deepseek":
-        return setup_deepseek(model)
-
-    raise ValueError(f"Provedor '{provider}' não suportado para o modelo {model}")
+    return _setup_model(model)
 
 
 def get_available_models() -> dict:
@@ -307,18 +392,36 @@ def check_api_keys() -> dict:
     }
 
 
-# Função de compatibilidade com o código existente
-import copy
+@lru_cache(maxsize=None)
+def _get_llm_cache():
+    """Importa o cache de LLM só quando for usado pela primeira vez."""
+    try:
+        from t2ebm.cache import get_llm_cache
+    except ImportError:
+        print("Warning: LLM cache not available")
+        return None
+    return get_llm_cache()
+
+
+def _model_name(llm_instance: AbstractChatModel) -> str:
+    """Id do modelo usado nas chaves do cache (independente do __repr__ da classe)."""
+    return llm_instance.model or str(llm_instance)
+
 
-# Importar cache de LLM
-try:
-    from t2ebm.cache import get_llm_cache
-    LLM_CACHE_AVAILABLE = True
-except ImportError:
-    LLM_CACHE_AVAILABLE = False
-    print("Warning: LLM cache not available")
+def _has_pending_assistant(messages) -> bool:
+    """Indica se alguma mensagem do assistente ainda precisa ser gerada."""
+    return any(m["role"] == "assistant" and "content" not in m for m in messages)
 
 
+def _strip_assistant_keys(messages):
+    """Cópia das mensagens com apenas role e content nas mensagens do assistente."""
+    return [
+        {"role": "assistant", "content": m["content"]} if m["role"] == "assistant" else dict(m)
+        for m in messages
+    ]
+
+
+# Função de compatibilidade com o código existente
 def chat_completion(llm, messages, use_cache: bool = True):
     """Executa uma sequência de mensagens com um AbstractChatModel.
     
@@ -330,11 +433,14 @@ def chat_completion(llm, messages, use_cache: bool = True):
         use_cache: Se True, usa cache para respostas LLM (padrão: True)
     """
     llm_instance = setup(llm)
-    model_name = str(llm_instance) if hasattr(llm_instance, '__str__') else str(llm)
-    messages = copy.deepcopy(messages)
+    if not _has_pending_assistant(messages):
+        return _strip_assistant_keys(messages)
+    model_name = _model_name(llm_instance)
+    # Só os dicionários de cada mensagem são alterados; as strings podem ser compartilhadas
+    messages = [dict(m) for m in messages]
     
     # Obter cache se disponível
-    cache = get_llm_cache() if LLM_CACHE_AVAILABLE and use_cache else None
+    cache = _get_llm_cache() if use_cache else None
     
     for msg_idx in range(len(messages)):
         if messages[msg_idx]["role"] == "assistant":
@@ -376,14 +482,128 @@ def chat_completion(llm, messages, use_cache: bool = True):
                         )
             
             # Remover chaves extras
-            keys = list(messages[msg_idx].keys())
-            for k in keys:
-                if k not in ["role", "content"]:
-                    messages[msg_idx].pop(k)
+            messages[msg_idx] = {"role": "assistant", "content": messages[msg_idx]["content"]}
+    
+    return messages
+
+
+
+async def achat_completion(llm, messages, use_cache: bool = True):
+    """Versão assíncrona de chat_completion.
+
+    Dentro de uma conversa as mensagens do assistente continuam sequenciais, pois cada uma
+    depende das respostas anteriores; o ganho vem de executar várias conversas ao mesmo tempo.
+    """
+    llm_instance = setup(llm)
+    if not _has_pending_assistant(messages):
+        return _strip_assistant_keys(messages)
+    model_name = _model_name(llm_instance)
+    messages = [dict(m) for m in messages]
+    
+    cache = _get_llm_cache() if use_cache else None
+    
+    for msg_idx in range(len(messages)):
+        if messages[msg_idx]["role"] == "assistant":
+            if "content" not in messages[msg_idx]:
+                context_messages = messages[:msg_idx]
+                cache_kwargs = {
+                    "temperature": messages[msg_idx].get("temperature", 0.7),
+                    "max_tokens": messages[msg_idx].get("max_tokens", 1000),
+                }
+                
+                # A consulta ao cache é síncrona (rápida) e evita a chamada ao LLM
+                cached_response = None
+                if cache:
+                    cached_response = cache.get_cached_response(model_name, context_messages, **cache_kwargs)
+                
+                if cached_response:
+                    messages[msg_idx]["content"] = cached_response
+                else:
+                    response = await llm_instance.achat_completion(
+                        context_messages,
+                        temperature=cache_kwargs["temperature"],
+                        max_tokens=cache_kwargs["max_tokens"],
+                    )
+                    messages[msg_idx]["content"] = response
+                    
+                    if cache and response:
+                        cache.set_cached_response(model_name, context_messages, response, **cache_kwargs)
+            
+            # Remover chaves extras
+            messages[msg_idx] = {"role": "assistant", "content": messages[msg_idx]["content"]}
     
     return messages
 
 
+def chat_completion_many(llm, conversations, use_cache: bool = True):
+    """Executa várias conversas independentes em paralelo com asyncio.gather.
+
+    Não pode ser chamada de dentro de um event loop em execução (ex.: Jupyter); nesse caso use
+    `await asyncio.gather(*(achat_completion(llm, m) for m in conversations))`.
+
+    Args:
+        llm: O modelo LLM ou string com nome do modelo
+        conversations: Lista de listas de mensagens no formato OpenAI
+        use_cache: Se True, usa cache para respostas LLM (padrão: True)
+
+    Returns:
+        list: As conversas completas, na mesma ordem.
+    """
+    llm_instance = setup(llm)
+
+    async def _run():
+        try:
+            return await asyncio.gather(
+                *(achat_completion(llm_instance, messages, use_cache=use_cache) for messages in conversations)
+            )
+        finally:
+            # O cliente assíncrono fica preso a este event loop, que é fechado ao fim do asyncio.run
+            await llm_instance.aclose()
+
+    return asyncio.run(_run())
+
+def chat_completion_stream(llm, messages, use_cache: bool = True):
+    """Executa as mensagens como chat_completion, transmitindo em partes a resposta da última mensagem do assistente.
+
+    As mensagens anteriores do assistente são executadas normalmente (com cache).
+    
+    Args:
+        llm: O modelo LLM ou string com nome do modelo
+        messages: Lista de mensagens no formato OpenAI
+        use_cache: Se True, usa cache para respostas LLM (padrão: True)
+
+    Yields:
+        str: Trechos da resposta final.
+    """
+    llm_instance = setup(llm)
+    model_name = _model_name(llm_instance)
+    last_idx = max(
+        idx for idx, msg in enumerate(messages)
+        if msg["role"] == "assistant" and "content" not in msg
+    )
+    context_messages = chat_completion(llm_instance, messages[:last_idx], use_cache=use_cache)
+    cache_kwargs = {
+        "temperature": messages[last_idx].get("temperature", 0.7),
+        "max_tokens": messages[last_idx].get("max_tokens", 1000),
+    }
+    
+    cache = _get_llm_cache() if use_cache else None
+    if cache:
+        cached_response = cache.get_cached_response(model_name, context_messages, **cache_kwargs)
+        if cached_response:
+            yield cached_response
+            return
+    
+    parts = []
+    for part in llm_instance.chat_completion_stream(context_messages, **cache_kwargs):
+        parts.append(part)
+        yield part
+    
+    response = "".join(parts)
+    if cache and response:
+        cache.set_cached_response(model_name, context_messages, response, **cache_kwargs)
+
+
 def test_connection(model: str = "deepseek-chat") -> bool:
     """Testa a conexão com um modelo."""
     try:
@@ -34,7 +34,9 @@ setuptools.setup(
         "matplotlib",
         "tiktoken",
         "openai>=1.8.0",
+        "httpx",
         "tenacity",
+        "msgpack",
         "scipy",
         "interpret",
     ],
@@ -8,5 +8,6 @@ from .version import __version__
 from .functions import (
     feature_importances_to_text,
     describe_graph,
+    describe_graphs,
     describe_ebm,
 )
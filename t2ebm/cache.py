@@ -4,160 +4,386 @@ Cache module for storing simplified graph text representations and LLM responses
 
 import hashlib
 import json
+import logging
 import os
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any
-import pickle
 
-from interpret.glassbox import (
-    ExplainableBoostingClassifier,
-    ExplainableBoostingRegressor,
-)
+import msgpack
+import numpy as np
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+logger = logging.getLogger(__name__)
+
+
+def _new_hash():
+    """BLAKE3 hasher if available, 128-bit BLAKE2b otherwise."""
+    return blake3() if blake3 is not None else hashlib.blake2b(digest_size=16)
+
+
+def _atomic_write(path: str, data: bytes):
+    """Write to a temporary file and rename it over path, so readers never see a partial file."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _remove_entries(cache_dir: str):
+    """Remove all .msgpack cache entries in cache_dir, tolerating concurrent clears."""
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.msgpack'):
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+    except FileNotFoundError:
+        pass
+
+
+def _graph_digest(graph) -> bytes:
+    """Hash of the content of an EBMGraph (feature name and type, x values, scores and stds)."""
+    h = _new_hash()
+    h.update(f"{graph.feature_name}\x00{graph.feature_type}\x00".encode())
+    for values in (graph.x_vals, graph.scores, graph.stds):
+        arr = np.asarray(values)
+        if arr.dtype.kind in "biuf":
+            h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+        else:
+            # categorical x values
+            h.update(repr(list(values)).encode())
+        h.update(b"|")
+    return h.digest()
+
+
+class _MemoryLRU:
+    """Small thread-safe in-process LRU kept in front of the on-disk caches."""
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
 
 
 class GraphCache:
     """Cache for storing simplified graph text representations."""
     
-    def __init__(self, cache_dir: str = ".cache"):
+    def __init__(self, cache_dir: str = ".cache", memory_capacity: int = 512):
         self.cache_dir = cache_dir
+        self._mem = _MemoryLRU(memory_capacity)
         os.makedirs(cache_dir, exist_ok=True)
     
-    def _generate_cache_key(self, ebm, feature_index: int, **kwargs) -> str:
-        """Generate a unique cache key for EBM + feature + parameters."""
-        # Create a hash from EBM metadata and parameters
-        hash_data = {
-            "feature_names": list(ebm.feature_names_in_),
-            "feature_types": list(ebm.feature_types_in_),
-            "feature_index": feature_index,
-            "bins": [list(b) for b in ebm.bins_],
-            "kwargs": kwargs
-        }
-        
-        # Convert to JSON string and hash
-        json_str = json.dumps(hash_data, sort_keys=True, default=str)
-        return hashlib.md5(json_str.encode()).hexdigest()
+    def _generate_cache_key(self, graph, **kwargs) -> str:
+        """Generate a unique cache key for the graph content + parameters.
+
+        Identical graphs share the entry, no matter which EBM or feature index they came from.
+        """
+        h = _new_hash()
+        h.update(_graph_digest(graph))
+        h.update(repr(sorted(kwargs.items())).encode())
+        return h.hexdigest()
     
-    def get_cached_graph_text(self, ebm, feature_index: int, **kwargs) -> Optional[str]:
+    def get_cached_graph_text(self, graph, **kwargs) -> Optional[str]:
         """Get cached graph text if it exists."""
-        cache_key = self._generate_cache_key(ebm, feature_index, **kwargs)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        cache_key = self._generate_cache_key(graph, **kwargs)
+        graph_text = self._mem.get(cache_key)
+        if graph_text is not None:
+            return graph_text
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.msgpack")
         
         if os.path.exists(cache_file):
             try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                return cache_data.get('graph_text')
-            except (json.JSONDecodeError, KeyError):
+                with open(cache_file, 'rb') as f:
+                    cache_data = msgpack.unpackb(f.read(), raw=False)
+                graph_text = cache_data.get('graph_text')
+                if graph_text is not None:
+                    self._mem.put(cache_key, graph_text)
+                return graph_text
+            except (ValueError, KeyError):
                 return None
         return None
     
-    def set_cached_graph_text(self, ebm, feature_index: int, graph_text: str, **kwargs):
+    def set_cached_graph_text(self, graph, graph_text: str, **kwargs):
         """Cache graph text for future use."""
-        cache_key = self._generate_cache_key(ebm, feature_index, **kwargs)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        cache_key = self._generate_cache_key(graph, **kwargs)
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.msgpack")
         
         cache_data = {
             'graph_text': graph_text,
-            'feature_name': ebm.feature_names_in_[feature_index],
-            'feature_index': feature_index,
+            'feature_name': str(graph.feature_name),
             'kwargs': kwargs
         }
         
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2)
+        _atomic_write(cache_file, msgpack.packb(cache_data, use_bin_type=True))
+        self._mem.put(cache_key, graph_text)
     
     def clear_cache(self):
         """Clear all cached graph data."""
-        if os.path.exists(self.cache_dir):
-            for file in os.listdir(self.cache_dir):
-                if file.endswith('.json'):
-                    os.remove(os.path.join(self.cache_dir, file))
+        self._mem.clear()
+        _remove_entries(self.cache_dir)
 
 
 class LLMResponseCache:
     """Cache for storing LLM responses to avoid redundant API calls."""
     
-    def __init__(self, cache_dir: str = ".cache/llm_responses", ttl_hours: int = 24):
+    def __init__(self, cache_dir: str = ".cache/llm_responses", ttl_hours: int = 24, memory_capacity: int = 512):
         self.cache_dir = cache_dir
         self.ttl_seconds = ttl_hours * 3600
+        # cache_key -> (timestamp, response)
+        self._mem = _MemoryLRU(memory_capacity)
         os.makedirs(cache_dir, exist_ok=True)
     
     def _generate_cache_key(self, model: str, messages: list, **kwargs) -> str:
         """Generate a unique cache key for model + messages + parameters."""
-        hash_data = {
-            "model": model,
-            "messages": messages,
-            "kwargs": kwargs
-        }
-        json_str = json.dumps(hash_data, sort_keys=True, default=str)
-        return hashlib.md5(json_str.encode()).hexdigest()
+        h = _new_hash()
+        h.update(str(model).encode())
+        h.update(b"\x00")
+        h.update(json.dumps(messages, sort_keys=True, default=str).encode())
+        h.update(b"\x00")
+        h.update(repr(sorted(kwargs.items())).encode())
+        return h.hexdigest()
     
     def get_cached_response(self, model: str, messages: list, **kwargs) -> Optional[str]:
         """Get cached LLM response if it exists and is not expired."""
         cache_key = self._generate_cache_key(model, messages, **kwargs)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        entry = self._mem.get(cache_key)
+        if entry is not None:
+            if time.time() - entry[0] < self.ttl_seconds:
+                logger.debug("[CACHE HIT] Using cached LLM response")
+                return entry[1]
+            self._mem.pop(cache_key)
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.msgpack")
         
-        if os.path.exists(cache_file):
+        try:
+            f = open(cache_file, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            # Check TTL against the file's modification time
+            cached_time = os.fstat(f.fileno()).st_mtime
+            if time.time() - cached_time >= self.ttl_seconds:
+                expired = True
+            else:
+                expired = False
+                try:
+                    response = msgpack.unpackb(f.read(), raw=False)['response']
+                except (ValueError, KeyError, TypeError):
+                    return None
+        if expired:
+            # Cache expired
             try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                
-                # Check TTL
-                cached_time = cache_data.get('timestamp', 0)
-                if time.time() - cached_time < self.ttl_seconds:
-                    print(f"[CACHE HIT] Using cached LLM response")
-                    return cache_data.get('response')
-                else:
-                    # Cache expired
-                    os.remove(cache_file)
-            except (json.JSONDecodeError, KeyError):
-                return None
-        return None
+                os.remove(cache_file)
+            except FileNotFoundError:
+                pass
+            return None
+        logger.debug("[CACHE HIT] Using cached LLM response")
+        self._mem.put(cache_key, (cached_time, response))
+        return response
     
     def set_cached_response(self, model: str, messages: list, response: str, **kwargs):
         """Cache LLM response for future use."""
         cache_key = self._generate_cache_key(model, messages, **kwargs)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.msgpack")
         
         cache_data = {
             'model': model,
             'response': response,
-            'timestamp': time.time(),
             'kwargs': kwargs
         }
         
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2)
+        _atomic_write(cache_file, msgpack.packb(cache_data, use_bin_type=True))
+        self._mem.put(cache_key, (time.time(), response))
         
-        print(f"[CACHE SET] Cached LLM response")
+        logger.debug("[CACHE SET] Cached LLM response")
     
     def clear_cache(self):
         """Clear all cached LLM responses."""
-        if os.path.exists(self.cache_dir):
-            for file in os.listdir(self.cache_dir):
-                if file.endswith('.json'):
-                    os.remove(os.path.join(self.cache_dir, file))
+        self._mem.clear()
+        _remove_entries(self.cache_dir)
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
-        if not os.path.exists(self.cache_dir):
-            return {"count": 0, "size_mb": 0}
-        
-        files = [f for f in os.listdir(self.cache_dir) if f.endswith('.json')]
-        total_size = sum(
-            os.path.getsize(os.path.join(self.cache_dir, f)) 
-            for f in files
-        )
+        count, total_size = 0, 0
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.msgpack'):
+                        count += 1
+                        total_size += entry.stat().st_size
+        except FileNotFoundError:
+            pass
         
         return {
-            "count": len(files),
+            "count": count,
             "size_mb": round(total_size / (1024 * 1024), 2)
         }
 
 
+class DescriptionCache:
+    """Persistent SQLite cache for final graph/model descriptions.
+
+    Entries are looked up by an exact key over (model, feature_index, language, custom_prompt, ebm_hash).
+    On an exact miss, the custom prompt can optionally be embedded with a small local sentence-transformer
+    (e.g. embedding_model="all-MiniLM-L6-v2") and compared against the prompts stored for the same
+    (model, feature_index, language, ebm_hash) scope. Semantic matching is off by default, and it is skipped
+    if sentence-transformers is not installed.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ".cache/descriptions.sqlite3",
+        similarity_threshold: float = 0.95,
+        embedding_model: Optional[str] = None,
+    ):
+        self.db_path = db_path
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = embedding_model
+        self._conn = None
+        self._encoder = None
+        self._lock = threading.Lock()
+        # only guards loading the encoder; encoding runs outside of the locks
+        self._encoder_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache("
+                "key TEXT PRIMARY KEY, scope TEXT, prompt TEXT, embedding BLOB, response TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_scope ON cache(scope)")
+            self._conn.commit()
+        return self._conn
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text with a local sentence-transformer, or return None if unavailable."""
+        if self.embedding_model is None:
+            return None
+        with self._encoder_lock:
+            if self._encoder is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    self.embedding_model = None
+                    return None
+                self._encoder = SentenceTransformer(self.embedding_model)
+        embedding = self._encoder.encode(text, normalize_embeddings=True)
+        return np.asarray(embedding, dtype=np.float32)
+
+    @staticmethod
+    def _generate_scope(model: str, feature_index, language: str, ebm_hash: str) -> str:
+        """Everything in the key except the custom prompt."""
+        scope = f"{model}|{feature_index}|{language}|{ebm_hash}"
+        return hashlib.sha256(scope.encode()).hexdigest()
+
+    @staticmethod
+    def _generate_cache_key(model: str, feature_index, language: str, custom_prompt: str, ebm_hash: str) -> str:
+        """Generate the exact-match key for a description request."""
+        key = f"{model}|{feature_index}|{language}|{custom_prompt}|{ebm_hash}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get_cached_description(
+        self, model: str, feature_index, language: str, custom_prompt: str, ebm_hash: str
+    ) -> Optional[str]:
+        """Get a cached description by exact key, falling back to semantic matching of the custom prompt."""
+        cache_key = self._generate_cache_key(model, feature_index, language, custom_prompt, ebm_hash)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response FROM cache WHERE key = ?", (cache_key,)).fetchone()
+            if row is not None:
+                return row[0]
+        embedding = self._embed(custom_prompt)
+        if embedding is None:
+            return None
+        scope = self._generate_scope(model, feature_index, language, ebm_hash)
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT embedding, response FROM cache WHERE scope = ? AND embedding IS NOT NULL",
+                (scope,),
+            ).fetchall()
+        best_similarity, best_response = -1.0, None
+        for blob, response in rows:
+            similarity = float(np.dot(np.frombuffer(blob, dtype=np.float32), embedding))
+            if similarity > best_similarity:
+                best_similarity, best_response = similarity, response
+        if best_similarity > self.similarity_threshold:
+            return best_response
+        return None
+
+    def set_cached_description(
+        self, model: str, feature_index, language: str, custom_prompt: str, ebm_hash: str, description: str
+    ):
+        """Cache a description for future use."""
+        cache_key = self._generate_cache_key(model, feature_index, language, custom_prompt, ebm_hash)
+        scope = self._generate_scope(model, feature_index, language, ebm_hash)
+        embedding = self._embed(custom_prompt)
+        blob = embedding.tobytes() if embedding is not None else None
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache(key, scope, prompt, embedding, response) VALUES (?, ?, ?, ?, ?)",
+                (cache_key, scope, custom_prompt, blob, description),
+            )
+            conn.commit()
+
+    def clear_cache(self):
+        """Clear all cached descriptions."""
+        with self._lock:
+            if self._conn is None and not os.path.exists(self.db_path):
+                return
+            conn = self._connect()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        if not os.path.exists(self.db_path):
+            return {"count": 0, "size_mb": 0}
+        with self._lock:
+            count = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            "count": count,
+            "size_mb": round(os.path.getsize(self.db_path) / (1024 * 1024), 2)
+        }
+
+
 # Global cache instances
 _graph_cache = GraphCache()
 _llm_cache = LLMResponseCache()
+_description_cache = DescriptionCache()
 
 
 def get_graph_cache() -> GraphCache:
@@ -170,6 +396,11 @@ def get_llm_cache() -> LLMResponseCache:
     return _llm_cache
 
 
+def get_description_cache() -> DescriptionCache:
+    """Get the global description cache instance."""
+    return _description_cache
+
+
 def clear_graph_cache():
     """Clear the global graph cache."""
     _graph_cache.clear_cache()
@@ -180,7 +411,13 @@ def clear_llm_cache():
     _llm_cache.clear_cache()
 
 
+def clear_description_cache():
+    """Clear the global description cache."""
+    _description_cache.clear_cache()
+
+
 def clear_all_caches():
     """Clear all caches."""
     clear_graph_cache()
     clear_llm_cache()
+    clear_description_cache()
@@ -2,10 +2,19 @@
 TalkToEBM: A Natural Language Interface to Explainable Boosting Machines.
 """
 
+import asyncio
+import functools
 import inspect
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import typing
 from typing import Union
 
+import numpy as np
+
 import t2ebm
 import t2ebm.llm
 from t2ebm.llm import AbstractChatModel
@@ -13,32 +22,73 @@ from t2ebm.llm import AbstractChatModel
 from t2ebm.graphs import extract_graph, graph_to_text
 
 import t2ebm.prompts as prompts
+from t2ebm.ratelimit import TokenBucket
 
 from interpret.glassbox import (
     ExplainableBoostingClassifier,
     ExplainableBoostingRegressor,
 )
 
+@functools.lru_cache(maxsize=None)
+def _parameters(fn) -> frozenset:
+    """The names of the parameters of fn, or of the function that it wraps (functools.wraps)."""
+    return frozenset(inspect.signature(inspect.unwrap(fn)).parameters)
+
+
+def _route(kw: dict, *fns) -> dict:
+    """The keyword arguments in kw that are parameters of any of the functions fns.
+
+    The parameters are looked up when a function is first routed to, so that functions replaced at runtime
+    (e.g. by the wrappers of the web app) work as well.
+    """
+    params = frozenset().union(*(_parameters(fn) for fn in fns))
+    return {k: kw[k] for k in kw.keys() & params}
+
+
+logger = logging.getLogger(__name__)
+
+# describe_ebm(..., single_call_mode=True) falls back to one request per feature above this number of features
+SINGLE_CALL_MAX_FEATURES = 5
+
+
+def run_async_(coro):
+    """Run a coroutine to completion from synchronous code.
+
+    Uses asyncio.run, or a separate thread if an event loop is already running in this thread (e.g. in Jupyter).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
 ###################################################################################################
 # Talk to the EBM about other things than graphs.
 ###################################################################################################
 
 
-def feature_importances_to_text(ebm: Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor]):
+def feature_importances_to_text(
+    ebm: Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor],
+    importances=None,
+):
     """Convert the feature importances of an EBM to text.
 
     Args:
         ebm (_type_): The EBM.
+        importances (array-like, optional): The term importances of the EBM, if they are already computed. Defaults to None.
 
     Returns:
         str: Textual representation of the feature importances.
     """
-    feature_importances = ""
-    for feature_idx, feature_name in enumerate(ebm.feature_names_in_):
-        feature_importances += (
-            f"{feature_name}: {ebm.term_importances()[feature_idx]:.2f}\n"
-        )
-    return feature_importances
+    # term_importances() recomputes the importances on every call
+    if importances is None:
+        importances = ebm.term_importances()
+    return "".join(
+        f"{feature_name}: {importances[feature_idx]:.2f}\n"
+        for feature_idx, feature_name in enumerate(ebm.feature_names_in_)
+    )
 
 
 ################################################################################################################
@@ -46,51 +96,70 @@ def feature_importances_to_text(ebm: Union[ExplainableBoostingClassifier, Explai
 ################################################################################################################
 
 
-def describe_graph(
-    llm: Union[AbstractChatModel, str],
+def describe_graph_messages(
     ebm: Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor],
     feature_index: int,
     num_sentences: int = 7,
     **kwargs,
 ):
-    """Ask the LLM to describe a graph. Uses chain-of-thought reasoning.
+    """The chain-of-thought messages that describe_graph sends to the LLM. Useful to execute them in a different way, e.g. streaming the final response.
 
     The function accepts additional keyword arguments that are passed to extract_graph, graph_to_text, and describe_graph_cot.
 
     Args:
-        llm (Union[AbstractChatModel, str]): The LLM.
         ebm (Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor]): The EBM.
         feature_index (int): The index of the feature to describe.
         num_sentences (int, optional): The desired number of senteces for the description. Defaults to 7.
 
     Returns:
-        str:  The description of the graph.
+        Messages in OpenAI format.
     """
-
-    # llm setup
-    llm = t2ebm.llm.setup(llm)
-
     # extract the graph from the EBM
-    extract_kwargs = list(inspect.signature(extract_graph).parameters)
-    extract_dict = {k: kwargs[k] for k in dict(kwargs) if k in extract_kwargs}
+    extract_dict = _route(kwargs, extract_graph)
     graph = extract_graph(ebm, feature_index, **extract_dict)
 
     # convert the graph to text
-    to_text_kwargs = list(inspect.signature(graph_to_text).parameters)
-    to_text_dict = {k: kwargs[k] for k in dict(kwargs) if k in to_text_kwargs}
+    to_text_dict = _route(kwargs, graph_to_text)
     # Pass ebm and feature_index for caching
     graph = graph_to_text(graph, ebm=ebm, feature_index=feature_index, **to_text_dict)
 
     # get a cot sequence of messages to describe the graph
-    llm_descripe_kwargs = list(inspect.signature(prompts.describe_graph_cot).parameters)
-    llm_descripe_kwargs.extend(
-        list(inspect.signature(prompts.describe_graph).parameters)
-    )
-    llm_descripe_dict = {k: kwargs[k] for k in dict(kwargs) if k in llm_descripe_kwargs}
+    # (describe_graph_cot passes its keyword arguments on to describe_graph)
+    llm_descripe_dict = _route(kwargs, prompts.describe_graph_cot, prompts.describe_graph)
     messages = prompts.describe_graph_cot(
         graph, num_sentences=num_sentences, **llm_descripe_dict
     )
 
+    return messages
+
+
+def describe_graph(
+    llm: Union[AbstractChatModel, str],
+    ebm: Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor],
+    feature_index: int,
+    num_sentences: int = 7,
+    **kwargs,
+):
+    """Ask the LLM to describe a graph. Uses chain-of-thought reasoning.
+
+    The function accepts additional keyword arguments that are passed to extract_graph, graph_to_text, and describe_graph_cot.
+
+    Args:
+        llm (Union[AbstractChatModel, str]): The LLM.
+        ebm (Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor]): The EBM.
+        feature_index (int): The index of the feature to describe.
+        num_sentences (int, optional): The desired number of senteces for the description. Defaults to 7.
+
+    Returns:
+        str:  The description of the graph.
+    """
+
+    # llm setup
+    llm = t2ebm.llm.setup(llm)
+
+    # get a cot sequence of messages to describe the graph
+    messages = describe_graph_messages(ebm, feature_index, num_sentences=num_sentences, **kwargs)
+
     # execute the prompt
     messages = t2ebm.llm.chat_completion(llm, messages)
 
@@ -98,11 +167,99 @@ def describe_graph(
     return messages[-1]["content"]
 
 
+def parse_json_list_(response: str):
+    """Parse a JSON list from an LLM response, ignoring any text (e.g. markdown code fences) around it. Returns None on failure."""
+    start, end = response.find("["), response.rfind("]")
+    if start == -1 or end == -1:
+        return None
+    try:
+        parsed = json.loads(response[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+
+def describe_graphs(
+    llm: Union[AbstractChatModel, str],
+    ebm: Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor],
+    feature_indices: typing.List[int],
+    num_sentences: int = 7,
+    max_batch_size: int = 8,
+    max_tokens_per_graph: int = 500,
+    **kwargs,
+):
+    """Ask the LLM to describe several graphs, sending up to max_batch_size graphs in a single request.
+
+    This saves one round-trip per graph compared to calling describe_graph for each feature. Descriptions that cannot be parsed from the batched response fall back to describe_graph.
+
+    The function accepts additional keyword arguments that are passed to extract_graph, graph_to_text, describe_graphs_batch, and (on fallback) describe_graph.
+
+    Args:
+        llm (Union[AbstractChatModel, str]): The LLM.
+        ebm (Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor]): The EBM.
+        feature_indices (List[int]): The indices of the features to describe.
+        num_sentences (int, optional): The desired number of senteces per description. Defaults to 7.
+        max_batch_size (int, optional): Maximum number of graphs per request, to stay within the context limit of the model. Defaults to 8.
+        max_tokens_per_graph (int, optional): The token budget per graph description. Defaults to 500.
+
+    Returns:
+        List[str]: The descriptions of the graphs, in the order of feature_indices.
+    """
+
+    # llm setup
+    llm = t2ebm.llm.setup(llm)
+
+    extract_dict = _route(kwargs, extract_graph)
+    to_text_dict = _route(kwargs, graph_to_text)
+    llm_batch_dict = _route(kwargs, prompts.describe_graphs_batch)
+
+    descriptions = [None] * len(feature_indices)
+    for batch_start in range(0, len(feature_indices), max_batch_size):
+        batch = feature_indices[batch_start : batch_start + max_batch_size]
+        graphs = [
+            graph_to_text(
+                extract_graph(ebm, feature_index, **extract_dict),
+                ebm=ebm,
+                feature_index=feature_index,
+                **to_text_dict,
+            )
+            for feature_index in batch
+        ]
+        messages = prompts.describe_graphs_batch(
+            graphs,
+            num_sentences=num_sentences,
+            max_tokens_per_graph=max_tokens_per_graph,
+            **llm_batch_dict,
+        )
+        response = t2ebm.llm.chat_completion(llm, messages)[-1]["content"]
+        parsed = parse_json_list_(response)
+        if parsed is None or len(parsed) != len(batch):
+            parsed = [None] * len(batch)
+        for offset, description in enumerate(parsed):
+            if isinstance(description, str) and len(description.strip()) > 0:
+                descriptions[batch_start + offset] = description.strip()
+
+    # fall back to individual requests for the descriptions that could not be parsed
+    for idx, feature_index in enumerate(feature_indices):
+        if descriptions[idx] is None:
+            descriptions[idx] = describe_graph(
+                llm, ebm, feature_index, num_sentences=num_sentences, **kwargs
+            )
+    return descriptions
+
+
 def describe_ebm(
     llm: Union[AbstractChatModel, str],
     ebm: Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor],
     num_sentences: int = 30,
     max_features: int = 5,  # Limit the number of features to analyze for performance
+    use_batch_api: bool = False,
+    single_call_mode: bool = False,
+    stream: bool = False,
+    max_concurrent_requests: typing.Optional[int] = None,
+    rpm: typing.Optional[float] = None,
+    tpm: typing.Optional[float] = None,
+    rate_limiter: typing.Optional[TokenBucket] = None,
     **kwargs,
 ):
     """Ask the LLM to describe an EBM. 
@@ -114,6 +271,13 @@ def describe_ebm(
         ebm (Union[ExplainableBoostingClassifier, ExplainableBoostingRegressor]): The EBM.
         num_sentences (int, optional): The desired number of senteces for the description. Defaults to 30.
         max_features (int, optional): Maximum number of features to analyze. Defaults to 5 for performance.
+        use_batch_api (bool, optional): Describe the features with the OpenAI Batch API (cheaper, but can take hours). Defaults to False.
+        single_call_mode (bool, optional): Describe all features and summarize the model in a single request instead of one request per feature plus the summary. Only used for at most SINGLE_CALL_MAX_FEATURES (5) features. Defaults to False.
+        stream (bool, optional): Stream the feature descriptions to stderr while they are generated. Each line is prefixed with the name of the feature. Defaults to False.
+        max_concurrent_requests (int, optional): Maximum number of features described at the same time. Defaults to the environment variable T2EBM_MAX_CONCURRENT_REQUESTS, or 8.
+        rpm (float, optional): Requests per minute allowed by the provider. Defaults to None (no limit).
+        tpm (float, optional): Tokens per minute allowed by the provider. Defaults to None (no limit).
+        rate_limiter (TokenBucket, optional): A token bucket to share the provider limits with other calls. If given, rpm and tpm are ignored. Defaults to None (a new bucket with rpm and tpm for this call).
 
     Returns:
         str: The description of the EBM.
@@ -123,102 +287,140 @@ def describe_ebm(
     llm = t2ebm.llm.setup(llm)
 
     # Get feature importances to prioritize the most important features
-    feature_importances = feature_importances_to_text(ebm)
-    
-    # Calculate feature importance scores
-    importance_scores = ebm.term_importances()
-    feature_indices = list(range(len(ebm.feature_names_in_)))
-    
-    # Sort features by absolute importance (most impactful first)
-    sorted_indices = sorted(feature_indices, key=lambda i: abs(importance_scores[i]), reverse=True)
-    
-    # Take only the top N features for analysis (performance optimization)
-    top_feature_indices = sorted_indices[:max_features]
-    
-    print(f"Analyzing top {len(top_feature_indices)} features out of {len(feature_indices)} total features")
-
-    # Extract and process only the top features
-    extract_kwargs = list(inspect.signature(extract_graph).parameters)
-    extract_dict = {k: kwargs[k] for k in dict(kwargs) if k in extract_kwargs}
-    
-    graphs = []
-    for feature_index in top_feature_indices:
-        graphs.append(extract_graph(ebm, feature_index, **extract_dict))
-
-    # convert the graphs to text
-    to_text_kwargs = list(inspect.signature(graph_to_text).parameters)
-    to_text_dict = {k: kwargs[k] for k in dict(kwargs) if k in to_text_kwargs}
-    # Pass ebm and feature_index for caching
-    graphs = [
-        graph_to_text(graph, ebm=ebm, feature_index=feature_index, **to_text_dict) 
-        for graph, feature_index in zip(graphs, top_feature_indices)
-    ]
+    # (term_importances() recomputes them on every call, so we compute them once)
+    importance_scores = np.asarray(ebm.term_importances())
+    feature_importances = feature_importances_to_text(ebm, importance_scores)
+    num_features = len(ebm.feature_names_in_)
+
+    # Take only the top N features by absolute importance (most impactful first).
+    # argpartition selects them in linear time, so that only these N have to be sorted.
+    abs_importances = np.abs(importance_scores[:num_features])
+    num_top = max(0, min(max_features, num_features))
+    if 0 < num_top < num_features:
+        candidates = np.sort(np.argpartition(-abs_importances, num_top - 1)[:num_top])
+    else:
+        candidates = np.arange(num_top)
+    top_feature_indices = candidates[np.argsort(-abs_importances[candidates], kind="stable")].tolist()
+    top_feature_names = [ebm.feature_names_in_[feature_index] for feature_index in top_feature_indices]
+
+    logger.info("Analyzing top %d features out of %d total features", len(top_feature_indices), num_features)
+
+    # The keyword arguments for extract_graph, graph_to_text and describe_graph_cot
+    extract_dict = _route(kwargs, extract_graph)
+    to_text_dict = _route(kwargs, graph_to_text)
+    # (describe_graph_cot passes its keyword arguments on to describe_graph)
+    llm_descripe_dict = _route(kwargs, prompts.describe_graph_cot, prompts.describe_graph)
+    llm_descripe_dict.pop("num_sentences", None)
+
+    def prepare_graph(feature_index):
+        """Extract the graph of a feature and convert it to text."""
+        graph = extract_graph(ebm, feature_index, **extract_dict)
+        return graph_to_text(graph, ebm=ebm, feature_index=feature_index, **to_text_dict)
+
+    def prepare_messages(feature_index):
+        """Get a cot sequence of messages to describe the graph of a feature."""
+        return prompts.describe_graph_cot(prepare_graph(feature_index), num_sentences=5, **llm_descripe_dict)  # Reduced from 7 to 5
+
+    if single_call_mode:
+        if len(top_feature_indices) <= SINGLE_CALL_MAX_FEATURES:
+            logger.info("Describing the features and the model in a single request")
+            llm_single_call_dict = _route(kwargs, prompts.describe_and_summarize_ebm)
+            messages = prompts.describe_and_summarize_ebm(
+                feature_importances,
+                [prepare_graph(feature_index) for feature_index in top_feature_indices],
+                top_feature_names,
+                num_sentences=num_sentences,
+                **llm_single_call_dict,
+            )
+            response = t2ebm.llm.chat_completion(llm, messages)[-1]["content"]
+            # return the summary section, or the whole response if the LLM did not follow the format
+            _, found, summary = response.rpartition("### Summary")
+            return summary.strip() if found else response
+        logger.info(
+            "Describing %d features with one request per feature (single_call_mode supports at most %d features)",
+            len(top_feature_indices),
+            SINGLE_CALL_MAX_FEATURES,
+        )
 
-    # get a cot sequence of messages to describe the graph
-    llm_descripe_kwargs = list(inspect.signature(prompts.describe_graph_cot).parameters)
-    llm_descripe_kwargs.extend(
-        list(inspect.signature(prompts.describe_graph).parameters)
-    )
-    llm_descripe_dict = {
-        k: kwargs[k]
-        for k in dict(kwargs)
-        if k in llm_descripe_kwargs and k != "num_sentences"
-    }
-    messages = [
-        prompts.describe_graph_cot(graph, num_sentences=5, **llm_descripe_dict)  # Reduced from 7 to 5
-        for graph in graphs
-    ]
-
-    # Helper function for parallel processing
-    def process_feature(args):
+    # Limit the concurrency and the request/token rate, so that we do not run into 429 errors
+    if max_concurrent_requests is None:
+        max_concurrent_requests = int(os.environ.get("T2EBM_MAX_CONCURRENT_REQUESTS", 8))
+    bucket = rate_limiter if rate_limiter is not None else TokenBucket(rpm=rpm, tpm=tpm)
+
+    def stream_messages(feature_name, messages):
+        """Execute the messages, printing the response line by line to stderr as it arrives, and return the response."""
+        parts = []
+        line = ""
+        for part in t2ebm.llm.chat_completion_stream(llm, messages):
+            parts.append(part)
+            *complete_lines, line = (line + part).split("\n")
+            for complete_line in complete_lines:
+                print(f"[{feature_name}] {complete_line}", file=sys.stderr, flush=True)
+        if line:
+            print(f"[{feature_name}] {line}", file=sys.stderr, flush=True)
+        return "".join(parts)
+
+    # Helper coroutine for concurrent processing
+    async def process_feature(idx, feature_index, semaphore):
         """Process a single feature description."""
-        idx, msg, feature_name = args
-        print(f"Processing feature: {feature_name}")
-        result = t2ebm.llm.chat_completion(llm, msg)[-1]["content"]
-        return idx, result
-
-    # Execute the prompts in parallel for better performance
-    print(f"Processing {len(messages)} features in parallel...")
-    graph_descriptions_dict = {}
-    
-    # Use ThreadPoolExecutor for parallel API calls
-    # max_workers=3 to avoid rate limiting while still gaining speedup
-    max_workers = min(3, len(messages))
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Prepare arguments for parallel processing
-        tasks = [
-            (i, msg, ebm.feature_names_in_[top_feature_indices[i]])
-            for i, msg in enumerate(messages)
+        # Prepare the graph in a worker thread, so that the requests for the features
+        # that are already prepared can start while the remaining graphs are processed
+        loop = asyncio.get_running_loop()
+        msg = await loop.run_in_executor(None, prepare_messages, feature_index)
+        async with semaphore:
+            # rough estimate: 4 characters per prompt token, plus the generated tokens
+            assistant_msgs = [m for m in msg if m["role"] == "assistant"]
+            estimated_tokens = sum(len(m.get("content", "")) for m in msg) // 4 + sum(
+                m["max_tokens"] for m in assistant_msgs
+            )
+            await bucket.aacquire(estimated_tokens, requests=len(assistant_msgs))
+            logger.debug("Processing feature: %s", top_feature_names[idx])
+            if stream:
+                result = await loop.run_in_executor(None, stream_messages, top_feature_names[idx], msg)
+            else:
+                result = (await t2ebm.llm.achat_completion(llm, msg))[-1]["content"]
+        logger.debug("Completed feature %d/%d", idx + 1, len(top_feature_indices))
+        return result
+
+    async def process_features():
+        # the semaphore has to be created inside the event loop that uses it
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
+        try:
+            # gather preserves the order of the features
+            return await asyncio.gather(
+                *(
+                    process_feature(i, feature_index, semaphore)
+                    for i, feature_index in enumerate(top_feature_indices)
+                )
+            )
+        finally:
+            # the async client of the llm is bound to this event loop, which is closed after the run
+            aclose = getattr(llm, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    if use_batch_api:
+        messages = [prepare_messages(feature_index) for feature_index in top_feature_indices]
+        logger.info("Processing %d features with the Batch API", len(messages))
+        graph_descriptions_list = [
+            conversation[-1]["content"]
+            for conversation in t2ebm.llm.batch_chat_completion(llm, messages)
         ]
-        
-        # Submit all tasks
-        futures = {executor.submit(process_feature, task): task[0] for task in tasks}
-        
-        # Collect results as they complete
-        for future in as_completed(futures):
-            idx, result = future.result()
-            graph_descriptions_dict[idx] = result
-            print(f"Completed feature {idx + 1}/{len(messages)}")
-    
-    # Reconstruct ordered list from dict
-    graph_descriptions_list = [graph_descriptions_dict[i] for i in range(len(messages))]
+    else:
+        # Execute the prompts concurrently for better performance
+        logger.info("Processing %d features concurrently", len(top_feature_indices))
+        graph_descriptions_list = run_async_(process_features())
 
     # combine the graph descriptions in a single string
     graph_descriptions = "\n\n".join(
-        [
-            ebm.feature_names_in_[top_feature_indices[idx]] + ": " + graph_description
-            for idx, graph_description in enumerate(graph_descriptions_list)
-        ]
+        f"{top_feature_names[idx]}: {graph_description}"
+        for idx, graph_description in enumerate(graph_descriptions_list)
     )
 
-    print("Generating final summary...")
+    logger.info("Generating final summary")
 
     # now, ask the llm to summarize the different descriptions
-    llm_summarize_kwargs = list(inspect.signature(prompts.summarize_ebm).parameters)
-    llm_summarize_dict = {
-        k: kwargs[k] for k in dict(kwargs) if k in llm_summarize_kwargs
-    }
+    llm_summarize_dict = _route(kwargs, prompts.summarize_ebm)
     messages = prompts.summarize_ebm(
         feature_importances,
         graph_descriptions,
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import scipy
 import json
+import logging
 
 from interpret.glassbox._ebm._utils import convert_to_intervals
 
@@ -17,6 +18,8 @@ from interpret.glassbox import (
 from t2ebm.utils import num_tokens_from_string_
 from t2ebm.cache import get_graph_cache
 
+logger = logging.getLogger(__name__)
+
 ###################################################################################################
 # Put individual graphs to text
 # Also has a datatype for graphs and various simple operations on this datatype.
@@ -217,8 +220,8 @@ def graph_to_text(
         confidence_bounds (bool, optional): Whether to inlcude confidence bounds. Defaults to True.
         confidence_level (float, optional): The desired confidence level of the bounds. Defaults to 0.95.
         max_tokens (int, optional): The maximum number of tokens that the textual description of the graph can have. The function simplifies the graph so to fit into this token limit. Defaults to 3000.
-        ebm: The EBM model (optional, required for caching).
-        feature_index (int, optional): The index of the feature in the EBM (required for caching).
+        ebm: Unused, kept for backward compatibility. The cache is keyed by the content of the graph.
+        feature_index (int, optional): Unused, kept for backward compatibility.
         use_cache (bool, optional): Whether to use cache for this conversion. Defaults to True.
 
     Raises:
@@ -228,8 +231,9 @@ def graph_to_text(
         str: The textual representation of the graph.
     """
     # Try to use cache if available
-    if use_cache and ebm is not None and feature_index is not None:
+    if use_cache:
         cache = get_graph_cache()
+        # the arguments as passed in (feature_format is auto-detected below)
         cache_kwargs = {
             'include_description': include_description,
             'feature_format': feature_format,
@@ -240,9 +244,9 @@ def graph_to_text(
             'max_tokens': max_tokens,
         }
         
-        cached_text = cache.get_cached_graph_text(ebm, feature_index, **cache_kwargs)
+        cached_text = cache.get_cached_graph_text(graph, **cache_kwargs)
         if cached_text is not None:
-            print(f"INFO: Using cached graph text for feature {graph.feature_name}")
+            logger.debug("Using cached graph text for feature %s", graph.feature_name)
             return cached_text
     # a simple auto-detect for boolean feautres
     try:
@@ -376,19 +380,9 @@ def graph_to_text(
                     )
                 
                 # Save to cache if enabled
-                if use_cache and ebm is not None and feature_index is not None:
-                    cache = get_graph_cache()
-                    cache_kwargs = {
-                        'include_description': include_description,
-                        'feature_format': feature_format,
-                        'x_axis_precision': x_axis_precision,
-                        'y_axis_precision': y_axis_precision,
-                        'confidence_bounds': confidence_bounds,
-                        'confidence_level': confidence_level,
-                        'max_tokens': max_tokens,
-                    }
-                    cache.set_cached_graph_text(ebm, feature_index, prompt, **cache_kwargs)
-                    print(f"INFO: Cached graph text for feature {graph.feature_name}")
+                if use_cache:
+                    cache.set_cached_graph_text(graph, prompt, **cache_kwargs)
+                    logger.debug("Cached graph text for feature %s", graph.feature_name)
                 
                 return prompt
         else:
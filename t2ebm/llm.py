@@ -5,12 +5,49 @@ We interface the LLM via the simple class AbstractChatModel. To use your own LLM
 """
 
 from dataclasses import dataclass
-from openai import OpenAI, AzureOpenAI, BadRequestError
+import httpx
+from openai import (
+    OpenAI,
+    AzureOpenAI,
+    AsyncOpenAI,
+    AsyncAzureOpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    BadRequestError,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_random_exponential,
+)
 
+import asyncio
 import copy
+import functools
+import json
 import os
+import time
+import weakref
 
-from typing import Union
+from typing import Optional, Union
+
+from t2ebm.cache import get_llm_cache
+
+
+# Transient provider errors (429, 5xx, connection errors and timeouts)
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Retry requests that failed with a transient error with jittered exponential backoff, for at most 4 attempts or 120 seconds
+_retry_transient = retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(4) | stop_after_delay(120),
+    reraise=True,
+)
 
 
 @dataclass
@@ -27,50 +64,114 @@ class AbstractChatModel:
         """
         raise NotImplementedError
 
+    def chat_completion_stream(self, messages, temperature: float, max_tokens: int):
+        """Streaming version of chat_completion that yields the response in parts as they arrive.
+
+        The default implementation yields the complete response at once.
+        """
+        yield self.chat_completion(messages, temperature, max_tokens)
+
+    async def achat_completion(self, messages, temperature: float, max_tokens: int):
+        """Async version of chat_completion.
+
+        The default implementation runs chat_completion in the default executor of the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.chat_completion, messages, temperature, max_tokens)
+        )
+
+    async def aclose(self):
+        """Release the resources that the model holds for the running event loop. Call it before the loop is closed.
+
+        The default implementation does nothing.
+        """
+
+
+class AsyncClientPerLoopMixin:
+    """Gives a chat model one async client per event loop.
+
+    The connections of an async client are bound to the event loop in which they were opened, and every asyncio.run
+    creates a new loop. A client from async_client_factory is therefore only used in the loop that it was created in.
+    A fixed async_client is used in every loop instead.
+    """
+
+    async_client = None
+    async_client_factory = None
+
+    def _get_async_client(self):
+        """The async client for the running event loop, or None."""
+        if self.async_client is not None or self.async_client_factory is None:
+            return self.async_client
+        # event loop -> async client created by async_client_factory
+        loop_async_clients = vars(self).setdefault("_loop_async_clients", weakref.WeakKeyDictionary())
+        loop = asyncio.get_running_loop()
+        async_client = loop_async_clients.get(loop)
+        if async_client is None:
+            async_client = loop_async_clients[loop] = self.async_client_factory()
+        return async_client
+
+    async def aclose(self):
+        """Close the async client that async_client_factory created for the running event loop. Call it before the loop is closed."""
+        loop_async_clients = vars(self).get("_loop_async_clients", {})
+        async_client = loop_async_clients.pop(asyncio.get_running_loop(), None)
+        if async_client is not None:
+            await async_client.close()
+
 
 class DummyChatModel(AbstractChatModel):
     def chat_completion(self, messages, temperature: float, max_tokens: int):
         return "Hihi, this is the dummy chat model! I hope you find me useful for debugging."
 
 
-class OpenAIChatModel(AbstractChatModel):
+class OpenAIChatModel(AsyncClientPerLoopMixin, AbstractChatModel):
     client: OpenAI = None
+    async_client: AsyncOpenAI = None
     model: str = None
 
-    def __init__(self, client, model):
+    def __init__(self, client, model, async_client=None, async_client_factory=None):
+        """
+        :param client: The OpenAI client.
+        :param model: The name of the model.
+        :param async_client: An AsyncOpenAI client, used in every event loop.
+        :param async_client_factory: Creates an AsyncOpenAI client, called once per event loop. Used if there is no async_client.
+        """
         super().__init__()
         self.client = client
+        self.async_client = async_client
+        self.async_client_factory = async_client_factory
         self.model = model
 
-    def chat_completion(self, messages, temperature, max_tokens):
-        def _send(temp_value, use_max_completion_tokens=True):
-            """Helper to call the API with the right param names."""
-            kwargs = {
-                "model": self.model,
-                "messages": messages,
-                "timeout": 90,
-            }
-            # Some models only accept the default temperature. Leave it out when None.
-            if temp_value is not None:
-                kwargs["temperature"] = temp_value
-            if use_max_completion_tokens:
-                kwargs["max_completion_tokens"] = max_tokens
-            else:
-                kwargs["max_tokens"] = max_tokens
-            return self.client.chat.completions.create(**kwargs)
+    def _request_kwargs(self, messages, temp_value, max_tokens, use_max_completion_tokens):
+        """The arguments for chat.completions.create."""
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "timeout": 60,
+        }
+        # Some models only accept the default temperature. Leave it out when None.
+        if temp_value is not None:
+            kwargs["temperature"] = temp_value
+        if use_max_completion_tokens:
+            kwargs["max_completion_tokens"] = max_tokens
+        else:
+            kwargs["max_tokens"] = max_tokens
+        return kwargs
 
-        try:
-            response = _send(temperature, use_max_completion_tokens=True)
-        except BadRequestError as exc:
-            exc_str = str(exc)
-            # Retry with legacy max_tokens if the model does not support max_completion_tokens.
-            if exc.code == "unsupported_parameter" and "max_tokens" in exc_str:
-                response = _send(temperature, use_max_completion_tokens=False)
-            # Some lightweight models do not support non-default temperature values.
-            elif exc.code == "unsupported_value" and "temperature" in exc_str:
-                response = _send(1, use_max_completion_tokens=True)
-            else:
-                raise
+    @staticmethod
+    def _fallback_args(exc: BadRequestError, temperature):
+        """The (temperature, use_max_completion_tokens) to retry with after a BadRequestError, or None."""
+        exc_str = str(exc)
+        # Retry with legacy max_tokens if the model does not support max_completion_tokens.
+        if exc.code == "unsupported_parameter" and "max_tokens" in exc_str:
+            return temperature, False
+        # Some lightweight models do not support non-default temperature values.
+        if exc.code == "unsupported_value" and "temperature" in exc_str:
+            return 1, True
+        return None
+
+    @staticmethod
+    def _response_content(response):
         # we return the completion string or "" if there is an invalid response/query
         try:
             response_content = response.choices[0].message.content
@@ -82,15 +183,72 @@ class OpenAIChatModel(AbstractChatModel):
             response_content = ""
         return response_content
 
+    def chat_completion(self, messages, temperature, max_tokens):
+        @_retry_transient
+        def _send(temp_value, use_max_completion_tokens=True):
+            """Helper to call the API with the right param names."""
+            return self.client.chat.completions.create(
+                **self._request_kwargs(messages, temp_value, max_tokens, use_max_completion_tokens)
+            )
+
+        try:
+            response = _send(temperature, use_max_completion_tokens=True)
+        except BadRequestError as exc:
+            fallback = self._fallback_args(exc, temperature)
+            if fallback is None:
+                raise
+            response = _send(*fallback)
+        return self._response_content(response)
+
+    def chat_completion_stream(self, messages, temperature, max_tokens):
+        @_retry_transient
+        def _send(temp_value, use_max_completion_tokens=True):
+            return self.client.chat.completions.create(
+                **self._request_kwargs(messages, temp_value, max_tokens, use_max_completion_tokens),
+                stream=True,
+            )
+
+        try:
+            stream = _send(temperature, use_max_completion_tokens=True)
+        except BadRequestError as exc:
+            fallback = self._fallback_args(exc, temperature)
+            if fallback is None:
+                raise
+            stream = _send(*fallback)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def achat_completion(self, messages, temperature, max_tokens):
+        async_client = self._get_async_client()
+        if async_client is None:
+            return await super().achat_completion(messages, temperature, max_tokens)
+
+        @_retry_transient
+        async def _send(temp_value, use_max_completion_tokens=True):
+            return await async_client.chat.completions.create(
+                **self._request_kwargs(messages, temp_value, max_tokens, use_max_completion_tokens)
+            )
+
+        try:
+            response = await _send(temperature, use_max_completion_tokens=True)
+        except BadRequestError as exc:
+            fallback = self._fallback_args(exc, temperature)
+            if fallback is None:
+                raise
+            response = await _send(*fallback)
+        return self._response_content(response)
+
     def __repr__(self) -> str:
         return f"{self.model}"
 
 
-def openai_setup(model: str, azure: bool = False, *args, **kwargs):
+def openai_setup(model: str, azure: bool = False, *args, async_http_client_factory=None, **kwargs):
     """Setup an OpenAI language model.
 
     :param model: The name of the model (e.g. "gpt-3.5-turbo-0613").
     :param azure: If true, use a model deployed on azure.
+    :param async_http_client_factory: Creates the httpx.AsyncClient of the async client, if a custom http_client is passed for the sync client.
 
     This function uses the following environment variables:
 
@@ -103,8 +261,10 @@ def openai_setup(model: str, azure: bool = False, *args, **kwargs):
     Returns:
         LLM_Interface: An LLM to work with!
     """
+    # requests are retried by _retry_transient, so the retries of the SDK are turned off by default
+    kwargs.setdefault("max_retries", 0)
     if azure:  # azure deployment
-        client = AzureOpenAI(
+        client_kwargs = dict(
             azure_endpoint=(
                 os.environ["AZURE_OPENAI_ENDPOINT"]
                 if "AZURE_OPENAI_ENDPOINT" in os.environ
@@ -120,36 +280,92 @@ def openai_setup(model: str, azure: bool = False, *args, **kwargs):
                 if "AZURE_OPENAI_VERSION" in os.environ
                 else None
             ),
-            *args,
-            **kwargs,
         )
+        client = AzureOpenAI(*args, **client_kwargs, **kwargs)
+        async_client_class = AsyncAzureOpenAI
     else:  # openai api
-        client = OpenAI(
+        client_kwargs = dict(
             api_key=(
                 os.environ["OPENAI_API_KEY"] if "OPENAI_API_KEY" in os.environ else None
             ),
             organization=(
                 os.environ["OPENAI_API_ORG"] if "OPENAI_API_ORG" in os.environ else None
             ),
-            *args,
-            **kwargs,
         )
+        client = OpenAI(*args, **client_kwargs, **kwargs)
+        async_client_class = AsyncOpenAI
+
+    # The async client is created once per event loop (its connections are bound to the loop).
+    # A custom (synchronous) http_client cannot be shared with the async client: use async_http_client_factory
+    # for the async client, or run the sync client in threads if there is none.
+    async_client_factory = None
+    if async_http_client_factory is not None:
+
+        def async_client_factory():
+            return async_client_class(
+                *args, **client_kwargs, **{**kwargs, "http_client": async_http_client_factory()}
+            )
+
+    elif "http_client" not in kwargs:
+        async_client_factory = functools.partial(async_client_class, *args, **client_kwargs, **kwargs)
 
     # the llm
-    return OpenAIChatModel(client, model)
+    return OpenAIChatModel(client, model, async_client_factory=async_client_factory)
+
+
+_POOL_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+
+
+def _http_client(client_class, limits: httpx.Limits = _POOL_LIMITS):
+    """Create an httpx.Client or httpx.AsyncClient with a connection pool. Uses HTTP/2 if the optional h2 package is installed."""
+    try:
+        return client_class(http2=True, limits=limits)
+    except ImportError:
+        return client_class(limits=limits)
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_http_client():
+    """The http client of the synchronous OpenAI clients, shared by all models so that the requests reuse the pooled connections."""
+    return _http_client(httpx.Client)
 
 
 def setup(model: Union[AbstractChatModel, str]):
-    """Setup a chat model. If the input is a string, we assume that it is the name of an OpenAI model."""
+    """Setup a chat model. If the input is a string, we assume that it is the name of an OpenAI model.
+
+    The synchronous clients of the models set up here share one connection pool. The async clients get a pool per
+    event loop, because their connections are bound to the loop in which they were opened.
+    """
     if isinstance(model, str):
-        model = openai_setup(model)
+        model = openai_setup(
+            model,
+            http_client=_shared_http_client(),
+            async_http_client_factory=functools.partial(_http_client, httpx.AsyncClient),
+        )
     return model
 
 
-def chat_completion(llm: Union[str, AbstractChatModel], messages):
+def _model_name(llm: AbstractChatModel) -> str:
+    """The name of the model in the keys of the response cache."""
+    return getattr(llm, "model", None) or repr(llm)
+
+
+def _response_cache(use_cache: Optional[bool], temperature):
+    """The LLM response cache for a message, or None if the message should not be cached.
+
+    By default (use_cache=None), only deterministic messages (temperature 0) are cached.
+    """
+    if use_cache is None:
+        use_cache = temperature == 0
+    return get_llm_cache() if use_cache else None
+
+
+def chat_completion(llm: Union[str, AbstractChatModel], messages, use_cache: Optional[bool] = None):
     """Execute a sequence of user and assistant messages with an AbstractChatModel.
 
-    Sends multiple individual messages to the AbstractChatModel.
+    Sends multiple individual messages to the AbstractChatModel. Cached responses are stored in the LLM response cache
+    (see t2ebm.cache), and identical requests to the same model are answered from the cache. With use_cache=None
+    (the default), only the messages with temperature 0 are cached; True caches all messages and False none.
     """
     llm = setup(llm)
     # we sequentially execute all assistant messages that do not have a content.
@@ -157,15 +373,163 @@ def chat_completion(llm: Union[str, AbstractChatModel], messages):
     for msg_idx in range(len(messages)):
         if messages[msg_idx]["role"] == "assistant":
             if not "content" in messages[msg_idx]:
-                # send message
-                messages[msg_idx]["content"] = llm.chat_completion(
-                    messages[:msg_idx],
-                    temperature=messages[msg_idx]["temperature"],
-                    max_tokens=messages[msg_idx]["max_tokens"],
-                )
+                cache_kwargs = {
+                    "temperature": messages[msg_idx]["temperature"],
+                    "max_tokens": messages[msg_idx]["max_tokens"],
+                }
+                cache = _response_cache(use_cache, cache_kwargs["temperature"])
+                response = None
+                if cache is not None:
+                    response = cache.get_cached_response(_model_name(llm), messages[:msg_idx], **cache_kwargs)
+                if response is None:
+                    # send message
+                    response = llm.chat_completion(messages[:msg_idx], **cache_kwargs)
+                    if cache is not None and response:
+                        cache.set_cached_response(_model_name(llm), messages[:msg_idx], response, **cache_kwargs)
+                messages[msg_idx]["content"] = response
             # remove all keys except "role" and "content"
             keys = list(messages[msg_idx].keys())
             for k in keys:
                 if not k in ["role", "content"]:
                     messages[msg_idx].pop(k)
     return messages
+
+
+async def achat_completion(llm: Union[str, AbstractChatModel], messages, use_cache: Optional[bool] = None):
+    """Async version of chat_completion.
+
+    The assistant messages of one conversation still run one after the other; use asyncio.gather to run several conversations concurrently.
+    """
+    llm = setup(llm)
+    messages = copy.deepcopy(messages)  # do not alter the input
+    for msg_idx in range(len(messages)):
+        if messages[msg_idx]["role"] == "assistant":
+            if not "content" in messages[msg_idx]:
+                cache_kwargs = {
+                    "temperature": messages[msg_idx]["temperature"],
+                    "max_tokens": messages[msg_idx]["max_tokens"],
+                }
+                cache = _response_cache(use_cache, cache_kwargs["temperature"])
+                response = None
+                if cache is not None:
+                    response = cache.get_cached_response(_model_name(llm), messages[:msg_idx], **cache_kwargs)
+                if response is None:
+                    # send message
+                    response = await llm.achat_completion(messages[:msg_idx], **cache_kwargs)
+                    if cache is not None and response:
+                        cache.set_cached_response(_model_name(llm), messages[:msg_idx], response, **cache_kwargs)
+                messages[msg_idx]["content"] = response
+            # remove all keys except "role" and "content"
+            keys = list(messages[msg_idx].keys())
+            for k in keys:
+                if not k in ["role", "content"]:
+                    messages[msg_idx].pop(k)
+    return messages
+
+
+def chat_completion_stream(llm: Union[str, AbstractChatModel], messages):
+    """Execute a sequence of user and assistant messages like chat_completion, streaming the response to the last assistant message.
+
+    The assistant messages before the last one are executed with chat_completion.
+
+    Yields:
+        str: The parts of the response to the last assistant message.
+    """
+    llm = setup(llm)
+    last_idx = max(
+        msg_idx
+        for msg_idx, msg in enumerate(messages)
+        if msg["role"] == "assistant" and not "content" in msg
+    )
+    context = chat_completion(llm, messages[:last_idx])
+    yield from llm.chat_completion_stream(
+        context,
+        temperature=messages[last_idx]["temperature"],
+        max_tokens=messages[last_idx]["max_tokens"],
+    )
+
+
+def batch_chat_completion(llm: Union[str, AbstractChatModel], list_of_messages, poll_interval: float = 30.0):
+    """Execute many independent conversations with the OpenAI Batch API.
+
+    The Batch API costs less than individual requests but can take up to 24 hours. Each round submits the next
+    assistant message of every conversation as one batch job, so a conversation with k assistant messages needs k rounds.
+    Requests that fail in the batch get an empty response.
+
+    Args:
+        llm (Union[str, AbstractChatModel]): An OpenAI model.
+        list_of_messages (list): The conversations, each a list of messages as for chat_completion.
+        poll_interval (float, optional): Seconds between status checks of a batch job. Defaults to 30.
+
+    Returns:
+        list: The completed conversations, in the same order.
+    """
+    llm = setup(llm)
+    if not isinstance(llm, OpenAIChatModel):
+        raise ValueError("The Batch API is only available for OpenAI models.")
+    # do not alter the input (copy each conversation separately, the same list may be passed twice)
+    conversations = [copy.deepcopy(messages) for messages in list_of_messages]
+    while True:
+        # the next assistant message without content in every conversation
+        pending = {}
+        for conv_idx, messages in enumerate(conversations):
+            for msg_idx, msg in enumerate(messages):
+                if msg["role"] == "assistant" and not "content" in msg:
+                    pending[conv_idx] = msg_idx
+                    break
+        if not pending:
+            break
+        requests = []
+        for conv_idx, msg_idx in pending.items():
+            messages = conversations[conv_idx]
+            body = llm._request_kwargs(
+                [{"role": m["role"], "content": m["content"]} for m in messages[:msg_idx]],
+                messages[msg_idx]["temperature"],
+                messages[msg_idx]["max_tokens"],
+                use_max_completion_tokens=True,
+            )
+            body.pop("timeout")
+            requests.append(
+                json.dumps(
+                    {
+                        "custom_id": str(conv_idx),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": body,
+                    }
+                )
+            )
+        batch_file = llm.client.files.create(
+            file=("batch.jsonl", "\n".join(requests).encode()), purpose="batch"
+        )
+        batch = llm.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = llm.client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+        responses = {}
+        if batch.output_file_id is not None:
+            for line in llm.client.files.content(batch.output_file_id).text.splitlines():
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    responses[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        for conv_idx, msg_idx in pending.items():
+            response_content = responses.get(str(conv_idx))
+            if response_content is None:
+                print(f"Invalid response for conversation {conv_idx} in batch {batch.id}")
+                response_content = ""
+            conversations[conv_idx][msg_idx]["content"] = response_content
+    # remove all keys except "role" and "content"
+    return [
+        [
+            {"role": msg["role"], "content": msg["content"]} if msg["role"] == "assistant" else msg
+            for msg in messages
+        ]
+        for messages in conversations
+    ]
@@ -95,6 +95,105 @@ def describe_graph_cot(graph, num_sentences=7, language: str = None, **kwargs):
     ]
 
 
+def describe_graphs_batch(
+    graphs: list,
+    graph_description="",
+    dataset_description="",
+    task_description="",
+    num_sentences: int = 7,
+    max_tokens_per_graph: int = 500,
+    language: str = None,
+):
+    """Prompt the LLM to describe several graphs in a single request. The response is a JSON list with one description per graph.
+
+    Args:
+        graphs (list): The graphs to describe (in JSON format, obtained from graph_to_text).
+        graph_description (str, optional): Additional description of the graphs (e.g. "The y-axis of the graph depicts the probability of sucess."). Defaults to "".
+        dataset_description (str, optional): Additional description of the dataset. Defaults to "".
+        task_description (str, optional): An additional instruction from the user. Defaults to "".
+        num_sentences (int, optional): The desired number of sentences per description. Defaults to 7.
+        max_tokens_per_graph (int, optional): The token budget per graph description. Defaults to 500.
+        language (str, optional): Language instruction (e.g. "Portuguese (Brazil)"). Defaults to None.
+
+    Returns:
+        Messages in OpenAI format.
+    """
+    prompt = """Below are the graphs of a Generalized Additive Model (GAM). Each graph is presented as a JSON object with keys representing the x-axis and values representing the y-axis. For continuous features, the keys are intervals that represent ranges where the function predicts the same value. For categorical features, each key represents a possible value that the feature can take.\n\n"""
+    for idx, graph in enumerate(graphs):
+        prompt += f"Graph {idx + 1}:\n\n{graph}\n\n"
+    if graph_description is not None and len(graph_description) > 0:
+        prompt += f"{graph_description}\n\n"
+    if dataset_description is not None and len(dataset_description) > 0:
+        prompt += f"Here is a description of the dataset that the model was trained on:\n\n{dataset_description}\n\n"
+    if task_description is not None and len(task_description) > 0:
+        prompt += f"Additional instruction from the user: {task_description}\n\n"
+    prompt += f"Describe each of the {len(graphs)} graphs in at most {num_sentences} sentences, highlighting any surprising or counterintuitive patterns. Return only a JSON list of {len(graphs)} strings, where the i-th string is the description of Graph i."
+    if language is not None:
+        prompt += f" Please respond in {language}."
+    return [
+        {"role": "system", "content": graph_system_msg(language=language)},
+        {"role": "user", "content": prompt},
+        {
+            "role": "assistant",
+            "temperature": 0.7,
+            "max_tokens": max_tokens_per_graph * len(graphs),
+        },
+    ]
+
+
+def describe_and_summarize_ebm(
+    feature_importances: str,
+    graphs: list,
+    feature_names: list,
+    expert_description="an expert statistician and data scientist",
+    dataset_description="",
+    task_description="",
+    num_sentences: int = None,
+    sentences_per_feature: int = 5,
+    language: str = None,
+):
+    """Prompt the LLM to describe the graphs of several features and summarize the model in a single response.
+
+    The response has one section per feature, headed by "### <feature name>", and ends with a section headed by "### Summary".
+
+    Args:
+        feature_importances (str): The global feature importances (obtained from feature_importances_to_text).
+        graphs (list): The graphs to describe (in JSON format, obtained from graph_to_text).
+        feature_names (list): The names of the features of the graphs.
+        expert_description (str, optional): The expert that the LLM should impersonate. Defaults to "an expert statistician and data scientist".
+        dataset_description (str, optional): Additional description of the dataset. Defaults to "".
+        task_description (str, optional): An additional instruction from the user. Defaults to "".
+        num_sentences (int, optional): The desired maximum number of sentences of the summary. Defaults to None.
+        sentences_per_feature (int, optional): The desired number of sentences per feature description. Defaults to 5.
+        language (str, optional): Language instruction (e.g. "Portuguese (Brazil)"). Defaults to None.
+
+    Returns:
+        Messages in OpenAI format.
+    """
+    system_msg = f"You are {expert_description}. Your task is to describe and summarize a Generalized Additive Model (GAM). The model consists of different graphs that contain the effect of a specific input feature. "
+    if language is not None:
+        system_msg += f"Always respond in {language}. "
+    user_msg = """Below are the graphs of a Generalized Additive Model (GAM). Each graph is presented as a JSON object with keys representing the x-axis and values representing the y-axis. For continuous features, the keys are intervals that represent ranges where the function predicts the same value. For categorical features, each key represents a possible value that the feature can take.\n\n"""
+    for feature_name, graph in zip(feature_names, graphs):
+        user_msg += f"Graph of the feature {feature_name}:\n\n{graph}\n\n"
+    user_msg += f"Here are the global feature importances.\n\n{feature_importances}\n\n"
+    if dataset_description is not None and len(dataset_description) > 0:
+        user_msg += f"Here is a description of the dataset that the model was trained on.\n\n{dataset_description}\n\n"
+    if task_description is not None and len(task_description) > 0:
+        user_msg += f"Additional instruction from the user: {task_description}\n\n"
+    user_msg += f"For each of the {len(graphs)} features, write a section headed by \"### <feature name>\" that describes its graph in {sentences_per_feature} sentences. "
+    user_msg += "Then write a section headed by \"### Summary\" with an overall summary of the model. The summary should contain the most important features in the model and their effect on the outcome. Unimportant effects and features can be ignored. Pay special attention to include any surprising patterns in the summary."
+    if num_sentences is not None:
+        user_msg += f" The summary should have at most {num_sentences} sentences."
+    if language is not None:
+        user_msg += f" Please respond in {language}."
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg},
+        {"role": "assistant", "temperature": 0.7, "max_tokens": 300 * len(graphs) + 2000},
+    ]
+
+
 def summarize_ebm(
     feature_importances: str,
     graph_descriptions: str,
@@ -0,0 +1,65 @@
+"""
+Client-side rate limiting for LLM requests.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """Token bucket for requests per minute (RPM) and tokens per minute (TPM) limits.
+
+    Both buckets start full and refill continuously. A caller that takes more than is available reserves the
+    difference and waits until it has been refilled, so concurrent callers are served in order and never burst
+    past the limits. The bucket is thread-safe and can be used from threads (acquire) or coroutines (aacquire).
+
+    Args:
+        rpm (Optional[float]): Requests per minute, or None for no limit.
+        tpm (Optional[float]): Tokens per minute, or None for no limit.
+        clock (Callable[[], float]): Returns the current time in seconds. Defaults to time.monotonic.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._requests = float(rpm) if rpm else 0.0
+        self._tokens = float(tpm) if tpm else 0.0
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int, requests: int) -> float:
+        """Take requests and tokens from the buckets and return how long the caller has to wait."""
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._last
+            self._last = now
+            wait = 0.0
+            if self.rpm:
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0) - requests
+                if self._requests < 0:
+                    wait = max(wait, -self._requests * 60.0 / self.rpm)
+            if self.tpm:
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0) - tokens
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens * 60.0 / self.tpm)
+            return wait
+
+    def acquire(self, tokens: int = 0, requests: int = 1):
+        """Block until the requests and tokens are available."""
+        wait = self._reserve(tokens, requests)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0, requests: int = 1):
+        """Wait without blocking the event loop until the requests and tokens are available."""
+        wait = self._reserve(tokens, requests)
+        if wait > 0:
+            await asyncio.sleep(wait)
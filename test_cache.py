@@ -4,13 +4,13 @@ Test script to verify the cache system is working correctly.
 
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append('.')
 
-from t2ebm.cache import get_graph_cache, clear_graph_cache
+from t2ebm.cache import get_graph_cache, clear_graph_cache, _graph_digest
 from t2ebm.graphs import extract_graph, graph_to_text
 from interpret.glassbox import ExplainableBoostingClassifier
 import numpy as np
-from sklearn.model_selection import train_test_split
 
 # Create a simple test dataset
 np.random.seed(42)
@@ -28,34 +28,29 @@ print("Cache cleared")
 # Test cache functionality
 print("\n=== Testing Cache System ===")
 
-# First call - should process and cache
-print("\n1. First call (should process and cache):")
+# Convert the graphs in two threads to exercise the cache under concurrency:
+# feature 0 twice (the second call should use the cache) and feature 1 once
+print("\n1. Converting feature 0 twice and feature 1 once in two threads:")
 graph = extract_graph(ebm, 0)
-text1 = graph_to_text(graph, ebm=ebm, feature_index=0)
-print(f"First call completed. Text length: {len(text1)}")
-
-# Second call - should use cache
-print("\n2. Second call (should use cache):")
-text2 = graph_to_text(graph, ebm=ebm, feature_index=0)
-print(f"Second call completed. Text length: {len(text2)}")
+graph_diff = extract_graph(ebm, 1)
+jobs = [(graph, 0), (graph, 0), (graph_diff, 1)]
+with ThreadPoolExecutor(2) as executor:
+    text1, text2, text3 = executor.map(
+        lambda job: graph_to_text(job[0], ebm=ebm, feature_index=job[1]), jobs
+    )
+print(f"Text lengths: {len(text1)}, {len(text2)}, {len(text3)}")
 
 # Verify they are the same
 print(f"\nTexts are identical: {text1 == text2}")
-
-# Test with different feature
-print("\n3. Different feature (should process and cache):")
-graph_diff = extract_graph(ebm, 1)
-text3 = graph_to_text(graph_diff, ebm=ebm, feature_index=1)
-print(f"Different feature completed. Text length: {len(text3)}")
-
-# Check cache directory
-cache_dir = ".cache"
-if os.path.exists(cache_dir):
-    cache_files = [f for f in os.listdir(cache_dir) if f.endswith('.json')]
-    print(f"\nCache files created: {len(cache_files)}")
-    for file in cache_files:
-        print(f"  - {file}")
-else:
-    print("\nNo cache directory found")
+assert text1 == text2
+
+# Check cache directory: one file per unique graph
+cache_dir = get_graph_cache().cache_dir
+cache_files = [f for f in os.listdir(cache_dir) if f.endswith('.msgpack')]
+print(f"\nCache files created: {len(cache_files)}")
+for file in cache_files:
+    print(f"  - {file}")
+unique_keys = {_graph_digest(g) for g, _ in jobs}
+assert len(cache_files) == len(unique_keys), (len(cache_files), len(unique_keys))
 
 print("\n=== Cache Test Complete ===")
@@ -0,0 +1,15 @@
+"""
+Shared test fixtures.
+"""
+
+import pytest
+
+import t2ebm.cache
+from t2ebm.cache import GraphCache, LLMResponseCache
+
+
+@pytest.fixture(autouse=True)
+def tmp_caches(tmp_path, monkeypatch):
+    """Point the global graph and LLM response caches to a temporary directory, so that the tests do not write into the repository."""
+    monkeypatch.setattr(t2ebm.cache, "_graph_cache", GraphCache(cache_dir=str(tmp_path / "graphs")))
+    monkeypatch.setattr(t2ebm.cache, "_llm_cache", LLMResponseCache(cache_dir=str(tmp_path / "llm_responses")))
@@ -0,0 +1,81 @@
+"""
+Tests for the caches in t2ebm.cache.
+"""
+
+import numpy as np
+
+import t2ebm.llm
+from t2ebm.cache import DescriptionCache, GraphCache, LLMResponseCache, get_llm_cache
+from t2ebm.graphs import EBMGraph
+
+
+def test_description_cache(tmp_path):
+    cache = DescriptionCache(db_path=str(tmp_path / "descriptions.sqlite3"), embedding_model=None)
+    args = ("deepseek-chat", 3, "English", "Describe the graph.", "ebmhash")
+    assert cache.get_cached_description(*args) is None
+    cache.set_cached_description(*args, "A description.")
+    assert cache.get_cached_description(*args) == "A description."
+    # a different feature or prompt is a miss
+    assert cache.get_cached_description("deepseek-chat", 4, *args[2:]) is None
+    assert cache.get_cached_description(*args[:3], "Other prompt.", "ebmhash") is None
+    assert cache.get_cache_stats()["count"] == 1
+    cache.clear_cache()
+    assert cache.get_cached_description(*args) is None
+
+
+def test_llm_response_cache(tmp_path):
+    cache = LLMResponseCache(cache_dir=str(tmp_path))
+    messages = [{"role": "user", "content": "Descreva o gráfico."}]
+    assert cache.get_cached_response("gpt-4o", messages, temperature=0.7) is None
+    cache.set_cached_response("gpt-4o", messages, "Uma descrição.", temperature=0.7)
+    assert cache.get_cached_response("gpt-4o", messages, temperature=0.7) == "Uma descrição."
+    assert cache.get_cached_response("gpt-4o", messages, temperature=0.0) is None
+    assert cache.get_cache_stats()["count"] == 1
+    cache.clear_cache()
+    assert cache.get_cached_response("gpt-4o", messages, temperature=0.7) is None
+
+
+def test_graph_cache_key_uses_graph_content(tmp_path):
+    # str() of an array longer than numpy's print threshold elides the middle; the key must not
+    x_vals = list(zip(np.linspace(0.0, 1.0, 5000), np.linspace(0.0, 1.0, 5000) + 1e-3))
+    scores = np.linspace(-1.0, 1.0, 5000)
+    other_scores = scores.copy()
+    other_scores[2500] += 1e-6
+    stds = np.full(5000, 0.1)
+    graph = EBMGraph("x", "continuous", x_vals, scores, stds)
+    same_graph = EBMGraph("x", "continuous", list(x_vals), scores.copy(), stds.copy())
+    other_graph = EBMGraph("x", "continuous", x_vals, other_scores, stds)
+    cache = GraphCache(cache_dir=str(tmp_path))
+    assert cache._generate_cache_key(graph) == cache._generate_cache_key(same_graph)
+    assert cache._generate_cache_key(graph) != cache._generate_cache_key(other_graph)
+    assert cache._generate_cache_key(graph) != cache._generate_cache_key(graph, max_tokens=1000)
+    cache.set_cached_graph_text(graph, "text")
+    assert cache.get_cached_graph_text(same_graph) == "text"
+
+
+def test_chat_completion_caches_deterministic_messages():
+    class CountingChatModel(t2ebm.llm.AbstractChatModel):
+        calls = 0
+
+        def chat_completion(self, messages, temperature, max_tokens):
+            CountingChatModel.calls += 1
+            return f"Response {CountingChatModel.calls}."
+
+    def messages(temperature):
+        return [
+            {"role": "user", "content": "Describe the graph."},
+            {"role": "assistant", "temperature": temperature, "max_tokens": 100},
+        ]
+
+    llm = CountingChatModel()
+    # temperature 0 is cached by default
+    first = t2ebm.llm.chat_completion(llm, messages(0))
+    assert t2ebm.llm.chat_completion(llm, messages(0)) == first
+    assert CountingChatModel.calls == 1
+    # other temperatures only with use_cache=True
+    t2ebm.llm.chat_completion(llm, messages(0.7))
+    t2ebm.llm.chat_completion(llm, messages(0.7))
+    assert CountingChatModel.calls == 3
+    assert get_llm_cache().get_cache_stats()["count"] == 1
+    t2ebm.llm.chat_completion(llm, messages(0.7), use_cache=True)
+    assert get_llm_cache().get_cache_stats()["count"] == 2
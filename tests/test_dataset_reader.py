@@ -0,0 +1,26 @@
+"""
+Tests for the CSV reader in dataset_reader.
+"""
+
+import pandas as pd
+import pytest
+
+import dataset_reader
+
+CSV = (
+    "Aluno;Semestre;Data de Início;Curso;var01;Periodo;EVASAO\n"
+    "1;2010.2;2011-03-01;Pedagogia;1,5;3;1\n"
+    "2;;2011-03-02;;;;0\n"
+    "3;2011.1;;NA;2,25;4;1\n"
+)
+
+
+def test_pyarrow_reader_matches_pandas(tmp_path):
+    pytest.importorskip("pyarrow")
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(CSV, encoding="utf-8")
+    expected = dataset_reader.read_csv_pandas(csv_path)
+    # the first read parses the CSV and writes the Parquet copy, the second reads the copy
+    pd.testing.assert_frame_equal(dataset_reader.read_dataset(csv_path), expected)
+    assert csv_path.with_suffix(".v2.parquet").exists()
+    pd.testing.assert_frame_equal(dataset_reader.read_dataset(csv_path), expected)
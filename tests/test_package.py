@@ -2,6 +2,9 @@
 Automates unit testing.
 """
 
+import asyncio
+import functools
+
 import t2ebm
 
 from interpret.glassbox import ExplainableBoostingClassifier
@@ -20,7 +23,50 @@ def test_package():
     ebm.fit(X, y)
     # high-level functions
     t2ebm.describe_graph(llm, ebm, 0)
+    assert len(t2ebm.describe_graphs(llm, ebm, [0, 2])) == 2
+    # a custom task description is passed through to the prompt
+    messages = t2ebm.functions.describe_graph_messages(ebm, 0, task_description="Custom task.")
+    assert messages[1]["content"].endswith("Custom task.")
     t2ebm.describe_ebm(llm, ebm)
     # graphs
     graph = t2ebm.graphs.extract_graph(ebm, 1)
     t2ebm.graphs.graph_to_text(graph)
+
+
+def test_describe_graph_with_wrapped_functions(monkeypatch):
+    # the web app replaces extract_graph and graph_to_text with functools.wraps wrappers
+    calls = []
+
+    @functools.wraps(t2ebm.graphs.graph_to_text)
+    def graph_to_text(graph, **kwargs):
+        calls.append(kwargs)
+        return t2ebm.graphs.graph_to_text(graph, **kwargs)
+
+    monkeypatch.setattr(t2ebm.functions, "graph_to_text", graph_to_text)
+    np.random.seed(0)
+    X = np.random.randn(100, 3)
+    y = (X[:, 0] > 0).astype(int)
+    ebm = ExplainableBoostingClassifier(interactions=0).fit(X, y)
+    t2ebm.functions.describe_graph_messages(ebm, 0, max_tokens=1000, task_description="Custom task.")
+    # only the parameters of graph_to_text are passed to it
+    assert calls[0]["max_tokens"] == 1000 and "task_description" not in calls[0]
+
+
+def test_openai_async_client_per_event_loop():
+    # the connections of an async client are bound to its event loop, and every describe_ebm call runs a new loop
+    class AsyncClient:
+        closed = False
+
+        async def close(self):
+            self.closed = True
+
+    llm = t2ebm.llm.OpenAIChatModel(None, "gpt-4o", async_client_factory=AsyncClient)
+
+    async def run():
+        async_client = llm._get_async_client()
+        assert llm._get_async_client() is async_client
+        await llm.aclose()
+        return async_client
+
+    first, second = asyncio.run(run()), asyncio.run(run())
+    assert first is not second and first.closed and second.closed
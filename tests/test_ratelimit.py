@@ -0,0 +1,86 @@
+"""
+Tests for the token bucket in t2ebm.ratelimit.
+"""
+
+import asyncio
+
+import numpy as np
+from interpret.glassbox import ExplainableBoostingClassifier
+
+import t2ebm
+from t2ebm.ratelimit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_requests_per_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(rpm=2, clock=clock)
+    # the bucket starts full
+    assert bucket._reserve(0, 1) == 0
+    assert bucket._reserve(0, 1) == 0
+    # one request per 30 seconds is refilled
+    assert bucket._reserve(0, 1) == 30
+    clock.now = 30
+    # the refill went to the previous reservation
+    assert bucket._reserve(0, 1) == 30
+    clock.now = 1000
+    # the refill is capped at the size of the bucket
+    assert bucket._reserve(0, 2) == 0
+    assert bucket._reserve(0, 1) == 30
+
+
+def test_token_bucket_tokens_per_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(tpm=600, clock=clock)
+    assert bucket._reserve(500, 1) == 0
+    # 400 tokens missing at 10 tokens per second
+    assert bucket._reserve(500, 1) == 40
+    clock.now = 40
+    assert bucket._reserve(0, 1) == 0
+    # without limits, nobody waits
+    assert TokenBucket(clock=clock)._reserve(10**9, 100) == 0
+
+
+def test_token_bucket_acquire_waits(monkeypatch):
+    sleeps = []
+
+    async def asleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr("t2ebm.ratelimit.time.sleep", sleeps.append)
+    monkeypatch.setattr("t2ebm.ratelimit.asyncio.sleep", asleep)
+    bucket = TokenBucket(rpm=1, clock=FakeClock())
+    bucket.acquire()
+    assert sleeps == []
+    bucket.acquire()
+    asyncio.run(bucket.aacquire())
+    assert sleeps == [60, 120]
+
+
+def test_describe_ebm_with_shared_rate_limiter():
+    class CountingBucket(TokenBucket):
+        requests = 0
+
+        async def aacquire(self, tokens=0, requests=1):
+            CountingBucket.requests += requests
+            await super().aacquire(tokens, requests)
+
+    np.random.seed(0)
+    X = np.random.randn(100, 3)
+    y = (X[:, 0] > 0).astype(int)
+    ebm = ExplainableBoostingClassifier(interactions=0).fit(X, y)
+    llm = t2ebm.llm.DummyChatModel()
+    bucket = CountingBucket()
+    t2ebm.describe_ebm(llm, ebm, max_features=2, rate_limiter=bucket)
+    first_call = CountingBucket.requests
+    assert first_call > 0
+    # the same bucket limits the requests of later calls
+    t2ebm.describe_ebm(llm, ebm, max_features=2, rate_limiter=bucket)
+    assert CountingBucket.requests == 2 * first_call